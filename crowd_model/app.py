@@ -63,13 +63,16 @@ def process_video_analysis(job_id, video_path, config):
         
         # Run main analysis
         print(f"Starting analysis for job {job_id}")
+        pipeline_stats = {}
         processing_fps, output_video_path = main_analysis_with_output(
             output_dir=job_dir,
-            save_video=True
+            save_video=True,
+            stats=pipeline_stats
         )
         
         jobs[job_id]['progress'] = 70
         jobs[job_id]['processing_fps'] = processing_fps
+        jobs[job_id]['pipeline_stats'] = pipeline_stats
         
         # Generate visualizations
         try:
@@ -61,9 +61,11 @@ def process_video_sync(video_path, config, temp_dir):
         print(f"Starting synchronous analysis for video: {video_path}")
         
         # Run main analysis
+        pipeline_stats = {}
         processing_fps, output_video_path = main_analysis_with_output(
             output_dir=temp_dir,
-            save_video=True
+            save_video=True,
+            stats=pipeline_stats
         )
         
         # Generate visualizations
@@ -108,6 +110,7 @@ def process_video_sync(video_path, config, temp_dir):
         return {
             'success': True,
             'processing_fps': processing_fps,
+            'pipeline_stats': pipeline_stats,
             'output_video': output_video_path,
             'temp_dir': temp_dir
         }
@@ -284,6 +287,7 @@ def analyze_and_download_all():
                 "original_filename": filename,
                 "processing_timestamp": datetime.now().isoformat(),
                 "processing_fps": result.get('processing_fps', 'N/A'),
+                "pipeline_stats": result.get('pipeline_stats', {}),
                 "config": config
             }
             zip_file.writestr("processing_info.json", json.dumps(info, indent=2))
@@ -393,6 +397,7 @@ def analyze_and_list_files():
             "original_filename": filename,
             "processing_timestamp": datetime.now().isoformat(),
             "processing_fps": result.get('processing_fps', 'N/A'),
+            "pipeline_stats": result.get('pipeline_stats', {}),
             "config": config,
             "available_files": available_files,
             "total_files": len([f for f in available_files.values() if f.get("available", False)]),
@@ -0,0 +1,85 @@
+"""
+Benchmark for the track to detection association step of the tracker.
+
+Builds gated appearance cost matrices for synthetic crowds of increasing
+size, the way deep_sort's matching cascade does, and compares one dense
+linear_sum_assignment over the whole matrix with the per-component solver
+linear_assignment.solve_components. Both must find the same matches.
+"""
+import argparse
+import time
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from config import FRAME_SIZE
+from deep_sort import linear_assignment
+from deep_sort.kalman_filter import KalmanFilter
+
+MAX_COSINE_DISTANCE = 0.7
+
+def synthetic_costs(num_people, rng, kf):
+	# People standing densely in the frame, heights in pixels at FRAME_SIZE
+	frame_width, frame_height = FRAME_SIZE, int(FRAME_SIZE * 9 / 16)
+	height = rng.uniform(30, 60, num_people)
+	xyah = np.c_[rng.uniform(0, frame_width, num_people), rng.uniform(0, frame_height, num_people),
+		np.full(num_people, 0.4), height]
+
+	# Tracks observed for a few frames, then predicted into the current one
+	mean = np.array([kf.initiate(measurement)[0] for measurement in xyah])
+	covariance = np.array([kf.initiate(measurement)[1] for measurement in xyah])
+	for _ in range(3):
+		mean, covariance = kf.multi_predict(mean, covariance)
+		mean, covariance = kf.multi_update(mean, covariance, xyah)
+	mean, covariance = kf.multi_predict(mean, covariance)
+
+	# Detections of the same people, shuffled, with some missed
+	walk = rng.normal(0, 0.05, (num_people, 2)) * height[:, None]
+	measurements = np.c_[xyah[:, :2] + walk, xyah[:, 2:]]
+	order = rng.permutation(num_people)[:int(num_people * 0.9)]
+	measurements = measurements[order]
+
+	# Small appearance distance to the own detection, larger to everyone else
+	cost_matrix = rng.uniform(0.2, 1.0, (num_people, len(order)))
+	cost_matrix[order, np.arange(len(order))] = rng.uniform(0, 0.4, len(order))
+	gating_distance = kf.multi_gating_distance(mean, covariance, measurements)
+	cost_matrix[gating_distance > linear_assignment.kalman_filter.chi2inv95[4]] = linear_assignment.INFTY_COST
+	cost_matrix[cost_matrix > MAX_COSINE_DISTANCE] = MAX_COSINE_DISTANCE + 1e-5
+	return cost_matrix
+
+def solve_dense(cost_matrix, max_distance):
+	rows, cols = linear_sum_assignment(cost_matrix)
+	feasible = cost_matrix[rows, cols] <= max_distance
+	return rows[feasible], cols[feasible]
+
+def time_per_frame(solve, matrices, repeat):
+	start = time.perf_counter()
+	for _ in range(repeat):
+		for cost_matrix in matrices:
+			solve(cost_matrix, MAX_COSINE_DISTANCE)
+	return (time.perf_counter() - start) / (repeat * len(matrices))
+
+def main():
+	parser = argparse.ArgumentParser(description="Tracker association benchmark")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 200, 300, 500], help="Crowd sizes to sweep")
+	parser.add_argument("--frames", type=int, default=20, help="Number of synthetic frames per crowd size")
+	parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions")
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(0)
+	kf = KalmanFilter()
+	print("{:>7} {:>11} {:>14} {:>9}".format("People", "Dense (ms)", "Components (ms)", "Speedup"))
+	for num_people in args.sizes:
+		matrices = [synthetic_costs(num_people, rng, kf) for _ in range(args.frames)]
+
+		# Both solvers must agree before their timings are worth comparing
+		for cost_matrix in matrices:
+			dense = set(zip(*solve_dense(cost_matrix, MAX_COSINE_DISTANCE)))
+			components = set(zip(*linear_assignment.solve_components(cost_matrix, MAX_COSINE_DISTANCE)))
+			assert dense == components
+
+		dense_time = time_per_frame(solve_dense, matrices, args.repeat)
+		components_time = time_per_frame(linear_assignment.solve_components, matrices, args.repeat)
+		print("{:>7} {:>11.3f} {:>14.3f} {:>8.1f}x".format(
+			num_people, dense_time * 1000, components_time * 1000, dense_time / components_time))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,65 @@
+"""
+Compare the YOLO detector engines on this host.
+
+Every backend in detector.DETECTOR_BACKENDS whose model files exist is
+loaded with the settings from YOLO_CONFIG and timed on the same frames from
+VIDEO_CONFIG["VIDEO_CAP"].
+"""
+import argparse
+import os
+import time
+import imutils
+import cv2
+from config import YOLO_CONFIG, VIDEO_CONFIG, FRAME_SIZE
+from detector import DETECTOR_BACKENDS, create_detector
+
+MODEL_FILES = {
+	"opencv": ("WEIGHTS_PATH", "CONFIG_PATH"),
+	"onnxruntime": ("ONNX_PATH",),
+}
+
+def read_frames(video_path, num_frames, frame_size):
+	cap = cv2.VideoCapture(video_path)
+	frames = []
+	while len(frames) < num_frames:
+		(ret, frame) = cap.read()
+		if not ret:
+			break
+		frames.append(imutils.resize(frame, width=frame_size))
+	cap.release()
+	return frames
+
+def main():
+	parser = argparse.ArgumentParser(description="YOLO detector engine benchmark")
+	parser.add_argument("--video", default=VIDEO_CONFIG["VIDEO_CAP"], help="Video to read frames from")
+	parser.add_argument("--frames", type=int, default=100, help="Number of frames to time")
+	parser.add_argument("--batch", type=int, default=1, help="Frames per infer call")
+	args = parser.parse_args()
+
+	frames = read_frames(args.video, args.frames, FRAME_SIZE)
+	if not frames:
+		print("No frames could be read from {}".format(args.video))
+		return
+
+	for backend in DETECTOR_BACKENDS:
+		missing = [YOLO_CONFIG[key] for key in MODEL_FILES[backend] if not os.path.exists(YOLO_CONFIG[key])]
+		if missing:
+			print("{:<12} skipped, missing {}".format(backend, ", ".join(missing)))
+			continue
+		try:
+			detector = create_detector(dict(YOLO_CONFIG, BACKEND=backend))
+		except ImportError as e:
+			print("{:<12} skipped, {}".format(backend, e))
+			continue
+
+		detections = 0
+		start = time.perf_counter()
+		for i in range(0, len(frames), args.batch):
+			for boxes, _, _ in detector.infer(frames[i:i + args.batch]):
+				detections += len(boxes)
+		elapsed = time.perf_counter() - start
+		print("{:<12} {:.1f} ms/frame, {:.1f} FPS, {} detections".format(
+			backend, elapsed * 1000 / len(frames), len(frames) / elapsed, detections))
+
+if __name__ == "__main__":
+	main()
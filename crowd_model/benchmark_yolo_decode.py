@@ -0,0 +1,91 @@
+"""
+Microbenchmark for the output decoding step of the YOLO detector.
+
+Compares the former per-row Python loop with the vectorized
+detector.decode_detections on synthetic YOLOv4-tiny (416x416) outputs and
+prints the per-frame decode time of both.
+"""
+import argparse
+import time
+import numpy as np
+from config import MIN_CONF, FRAME_SIZE
+from detector import decode_detections
+
+# YOLOv4-tiny output grids at 416x416 input, 3 anchors per cell, 80 COCO classes
+GRID_SIZES = (13, 26)
+NUM_ANCHORS = 3
+NUM_CLASSES = 80
+
+def synthetic_outputs(num_people, rng):
+	layer_outputs = []
+	for grid in GRID_SIZES:
+		rows = grid * grid * NUM_ANCHORS
+		output = np.zeros((rows, 5 + NUM_CLASSES), dtype=np.float32)
+		output[:, 0:2] = rng.uniform(0, 1, (rows, 2))
+		output[:, 2:4] = rng.uniform(0.01, 0.2, (rows, 2))
+		output[:, 4] = rng.uniform(0, 0.1, rows)
+		output[:, 5:] = rng.uniform(0, 0.05, (rows, NUM_CLASSES))
+		layer_outputs.append(output)
+	# Scatter confident person rows (plus a few other classes) across both layers
+	for _ in range(num_people):
+		output = layer_outputs[rng.integers(len(layer_outputs))]
+		row = rng.integers(len(output))
+		output[row, 4] = rng.uniform(0.5, 1)
+		output[row, 5 + rng.choice([0, 0, 0, 2])] = rng.uniform(0.2, 1)
+	return layer_outputs
+
+def decode_loop(layer_outputs, frame_width, frame_height):
+	boxes = []
+	centroids = []
+	confidences = []
+	for output in layer_outputs:
+		for detection in output:
+			scores = detection[5:]
+			class_id = np.argmax(scores)
+			confidence = scores[class_id]
+			if class_id == 0 and confidence > MIN_CONF:
+				box = detection[0:4] * np.array([frame_width, frame_height, frame_width, frame_height])
+				(center_x, center_y, width, height) = box.astype("int")
+				x = int(center_x - (width / 2))
+				y = int(center_y - (height / 2))
+				boxes.append([x, y, int(width), int(height)])
+				centroids.append((center_x, center_y))
+				confidences.append(float(confidence))
+	return boxes, centroids, confidences
+
+def time_per_frame(decode, frames, frame_width, frame_height, repeat):
+	start = time.perf_counter()
+	for _ in range(repeat):
+		for layer_outputs in frames:
+			decode(layer_outputs, frame_width, frame_height)
+	return (time.perf_counter() - start) / (repeat * len(frames))
+
+def main():
+	parser = argparse.ArgumentParser(description="YOLO output decoding benchmark")
+	parser.add_argument("--frames", type=int, default=50, help="Number of synthetic frames")
+	parser.add_argument("--people", type=int, default=150, help="Person detections per frame")
+	parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions")
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(0)
+	frame_width, frame_height = FRAME_SIZE, int(FRAME_SIZE * 9 / 16)
+	frames = [synthetic_outputs(args.people, rng) for _ in range(args.frames)]
+
+	# Both decoders must agree before their timings are worth comparing
+	for layer_outputs in frames:
+		loop_boxes, loop_centroids, loop_confidences = decode_loop(layer_outputs, frame_width, frame_height)
+		boxes, centroids, confidences = decode_detections(layer_outputs, frame_width, frame_height)
+		assert np.array_equal(np.reshape(loop_boxes, (-1, 4)), boxes)
+		assert np.array_equal(np.reshape(loop_centroids, (-1, 2)), centroids)
+		assert np.allclose(loop_confidences, confidences)
+
+	rows = sum(len(output) for output in frames[0])
+	loop_time = time_per_frame(decode_loop, frames, frame_width, frame_height, args.repeat)
+	vector_time = time_per_frame(decode_detections, frames, frame_width, frame_height, args.repeat)
+	print("Rows per frame: {}, person detections per frame: {}".format(rows, args.people))
+	print("Python loop decode: {:.3f} ms/frame".format(loop_time * 1000))
+	print("Vectorized decode:  {:.3f} ms/frame".format(vector_time * 1000))
+	print("Speedup: {:.1f}x".format(loop_time / vector_time))
+
+if __name__ == "__main__":
+	main()
@@ -6,13 +6,39 @@ VIDEO_CONFIG = {
 	"IS_CAM" : False,
 	"CAM_APPROX_FPS": 3,
 	"HIGH_CAM": False,
-	"START_TIME": datetime.datetime(2020, 11, 5, 0, 0, 0, 0)
+	"START_TIME": datetime.datetime(2020, 11, 5, 0, 0, 0, 0),
+	# Video decoder, "opencv" or "ffmpeg" (needs the ffmpeg executable)
+	"DECODER": "opencv",
+	# Width the ffmpeg decoder scales frames to, 0 keeps the native size
+	"DECODE_WIDTH": 0,
+	# Seek to the sampled frames instead of grabbing the skipped ones, opencv decoder only
+	"SEEK": False,
+	# Frames decoded ahead in a background thread while the detector runs, 0 decodes in the processing loop
+	"DECODE_QUEUE": 8,
+	# Region of interest polygons as (x, y) fractions of the frame size, e.g.
+	# [[(0.0, 0.4), (1.0, 0.4), (1.0, 1.0), (0.0, 1.0)]]. Empty detects on the whole frame
+	"ROI": []
 }
 
 # Load YOLOv3-tiny weights and config
 YOLO_CONFIG = {
+	"BACKEND" : "opencv",
 	"WEIGHTS_PATH" : "YOLOv4-tiny/yolov4-tiny.weights",
-	"CONFIG_PATH" : "YOLOv4-tiny/yolov4-tiny.cfg"
+	"CONFIG_PATH" : "YOLOv4-tiny/yolov4-tiny.cfg",
+	"ONNX_PATH" : "YOLOv4-tiny/yolov4-tiny.onnx",
+	"INPUT_SIZE" : 416,
+	"THREADS" : 0,
+	"TILE_GRID" : (1, 1),
+	"TILE_OVERLAP" : 0.2,
+	"TILE_FULL_FRAME" : True
+}
+
+# Re-ID appearance encoder model, a frozen graph (.pb) or an ONNX export (.onnx), the backend follows the file type unless set
+REID_CONFIG = {
+	"BACKEND" : None,
+	"MODEL_PATH" : "model_data/mars-small128.pb",
+	"MAX_BATCH_SIZE" : 128,
+	"GALLERY_BUDGET" : 100
 }
 # Show individuals detected
 SHOW_PROCESSING_OUTPUT = True
@@ -35,6 +61,8 @@ SHOW_VIOLATION_COUNT = False
 SHOW_TRACKING_ID = False
 # Threshold for distance violation
 SOCIAL_DISTANCE = 50
+# Check social distance with a spatial grid instead of all pairs from this many people
+PROXIMITY_GRID_MIN_PEOPLE = 200
 # Check for abnormal crowd activity
 ABNORMAL_CHECK = True
 # Min number of people to check for abnormal
@@ -50,4 +78,37 @@ NMS_THRESH = 0.2
 # Resize frame for processing
 FRAME_SIZE = 1080
 # Tracker max missing age before removing (seconds)
-TRACK_MAX_AGE = 3
\ No newline at end of file
+TRACK_MAX_AGE = 3
+# Number of frames detected together in one forward pass, video files only (1 disables batching)
+DETECT_BATCH_SIZE = 1
+# Detector keyframes: run YOLO on every Nth processed frame only and advance the tracks
+# with the Kalman filter in between (INTERVAL 1 runs the detector on every frame)
+KEYFRAME_CONFIG = {
+	"INTERVAL" : 1,
+	"ADAPTIVE" : False,
+	"MAX_INTERVAL" : 5,
+	"MAX_MOTION" : 0.25,
+	"MAX_UNCERTAINTY" : 0.2
+}
+# Motion gate: skip the detector and reuse the previous result while the scene is static
+MOTION_GATE_CONFIG = {
+	"ENABLED" : False,
+	"WIDTH" : 160,
+	"PIXEL_THRESH" : 25,
+	"MIN_CHANGED_RATIO" : 0.002,
+	"MAX_SKIP" : 50
+}
+# Processed video output of main_with_output.py and the API
+OUTPUT_VIDEO_CONFIG = {
+	"ENCODER" : "opencv",
+	"PRESET" : "veryfast",
+	"CRF" : 23,
+	"WIDTH" : 0,
+	"FRAME_STEP" : 1,
+	"QUEUE_SIZE" : 16
+}
+# Movement trails: live tracks keep the latest positions in memory and spool the older ones to disk in chunks
+MOVEMENT_CONFIG = {
+	"CHUNK_SIZE" : 256,
+	"TAIL" : 16
+}
\ No newline at end of file
@@ -2,10 +2,59 @@
 import numpy as np
 
 
+class DetectionBatch(object):
+    """
+    The detections of a single image, stacked into one array per attribute.
+
+    Parameters
+    ----------
+    tlwh : array_like
+        The Nx4 bounding boxes in format `(x, y, w, h)`.
+    confidence : array_like
+        The N detector confidence scores.
+    centroid : array_like
+        The Nx2 bounding box centroids.
+    feature : array_like
+        The NxM feature vectors that describe the objects contained in the
+        image.
+
+    Attributes
+    ----------
+    tlwh : ndarray
+        The Nx4 bounding boxes in format `(top left x, top left y, width,
+        height)`.
+    confidence : ndarray
+        The N detector confidence scores.
+    centroid : ndarray
+        The Nx2 bounding box centroids.
+    feature : ndarray
+        The NxM feature vectors.
+
+    """
+
+    __slots__ = ("tlwh", "confidence", "centroid", "feature")
+
+    def __init__(self, tlwh, confidence, centroid, feature):
+        self.tlwh = np.asarray(tlwh, dtype=float).reshape(-1, 4)
+        self.confidence = np.asarray(confidence, dtype=float).reshape(-1)
+        self.centroid = np.asarray(centroid)
+        self.feature = np.asarray(feature, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.tlwh)
+
+    def detections(self):
+        """Returns a list of `Detection` views, one per row of the batch."""
+        return [Detection.view(self, i) for i in range(len(self))]
+
+
 class Detection(object):
     """
     This class represents a bounding box detection in a single image.
 
+    A detection is a view into one row of a `DetectionBatch`, so the
+    detections of an image share their arrays.
+
     Parameters
     ----------
     tlwh : array_like
@@ -28,11 +77,35 @@ class Detection(object):
 
     """
 
+    __slots__ = ("_batch", "_index")
+
     def __init__(self, tlwh, confidence, centroid, feature):
-        self.tlwh = np.asarray(tlwh, dtype=float)
-        self.confidence = float(confidence)
-        self.feature = np.asarray(feature, dtype=np.float32)
-        self.centroid = centroid
+        self._batch = DetectionBatch([tlwh], [confidence], [centroid], [feature])
+        self._index = 0
+
+    @classmethod
+    def view(cls, batch, index):
+        """Create the detection of row `index` of `batch` without copying."""
+        detection = cls.__new__(cls)
+        detection._batch = batch
+        detection._index = index
+        return detection
+
+    @property
+    def tlwh(self):
+        return self._batch.tlwh[self._index]
+
+    @property
+    def confidence(self):
+        return float(self._batch.confidence[self._index])
+
+    @property
+    def centroid(self):
+        return self._batch.centroid[self._index]
+
+    @property
+    def feature(self):
+        return self._batch.feature[self._index]
 
     def to_tlbr(self):
         """Convert bounding box to format `(min x, min y, max x, max y)`, i.e.,
@@ -4,13 +4,19 @@ import errno
 import argparse
 import numpy as np
 import cv2
-import os
-os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
-import tensorflow.compat.v1 as tf
-    
-physical_devices = tf.config.experimental.list_physical_devices('GPU')
-if len(physical_devices) > 0:
-    tf.config.experimental.set_memory_growth(physical_devices[0], True)
+
+
+def _import_tensorflow():
+    """Import TensorFlow on first use. Only the TensorFlow encoder needs it,
+    and importing it takes seconds and hundreds of MB.
+    """
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    import tensorflow.compat.v1 as tf
+
+    physical_devices = tf.config.experimental.list_physical_devices('GPU')
+    if len(physical_devices) > 0:
+        tf.config.experimental.set_memory_growth(physical_devices[0], True)
+    return tf
 
 def _run_in_batches(f, data_dict, out, batch_size):
     data_len = len(out)
@@ -73,9 +79,65 @@ def extract_image_patch(image, bbox, patch_shape):
     return image
 
 
+def extract_image_patches(image, boxes, patch_shape, out=None):
+    """Extract the image patches of many bounding boxes at once.
+
+    Works like :func:`extract_image_patch`, but the aspect ratio correction
+    and clipping are computed for all boxes together, and every crop is
+    resized straight into its slot of one patch array.
+
+    Parameters
+    ----------
+    image : ndarray
+        The full image.
+    boxes : array_like
+        The bounding boxes in format (x, y, width, height).
+    patch_shape : array_like
+        The patch shape (height, width).
+    out : Optional[ndarray]
+        Array of shape (M, height, width, 3), M >= len(boxes), the patches
+        are written to. A new array is allocated if None.
+
+    Returns
+    -------
+    (ndarray, ndarray)
+        The patches, a view of the first len(boxes) rows of `out`, and a
+        boolean array that is False for boxes that are empty or fully
+        outside of the image. The patches of those boxes are not written.
+
+    """
+    boxes = np.array(boxes).reshape(-1, 4)
+    if out is None:
+        out = np.empty((len(boxes),) + tuple(patch_shape) + (3,), np.uint8)
+    patches = out[:len(boxes)]
+
+    # correct aspect ratio to patch shape
+    target_aspect = float(patch_shape[1]) / patch_shape[0]
+    new_width = target_aspect * boxes[:, 3]
+    boxes[:, 0] = boxes[:, 0] - (new_width - boxes[:, 2]) / 2
+    boxes[:, 2] = new_width
+
+    # convert to top left, bottom right
+    boxes[:, 2:] += boxes[:, :2]
+    boxes = boxes.astype(int)
+
+    # clip at image boundaries
+    boxes[:, :2] = np.maximum(0, boxes[:, :2])
+    boxes[:, 2:] = np.minimum(np.asarray(image.shape[:2][::-1]) - 1, boxes[:, 2:])
+    valid = np.all(boxes[:, :2] < boxes[:, 2:], axis=1)
+
+    size = tuple(patch_shape[::-1])
+    for i in np.flatnonzero(valid):
+        sx, sy, ex, ey = boxes[i]
+        cv2.resize(image[sy:ey, sx:ex], size, dst=patches[i])
+    return patches, valid
+
+
 class ImageEncoder(object):
+    """Runs the frozen TensorFlow graph of the re-ID network."""
 
     def __init__(self, checkpoint_filename, input_name="images", output_name="features"):
+        tf = _import_tensorflow()
         self.session = tf.Session()
         with tf.gfile.GFile(checkpoint_filename, "rb") as file_handle:
             graph_def = tf.GraphDef()
@@ -102,22 +164,150 @@ class ImageEncoder(object):
         return out
 
 
-def create_box_encoder(model_filename, input_name="images:0", output_name="features:0", batch_size=32):
-    image_encoder = ImageEncoder(model_filename, input_name, output_name)
-    image_shape = image_encoder.image_shape
+class ONNXImageEncoder(object):
+    """Runs an ONNX export of the re-ID network, e.g. a quantized variant
+    written by quantize_models.py, on the ONNX Runtime CPU provider.
+    """
+
+    def __init__(self, model_filename):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(
+            model_filename, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        model_output = self.session.get_outputs()[0]
+        self.input_name = model_input.name
+        self.output_name = model_output.name
+        self.input_dtype = np.uint8 if model_input.type == "tensor(uint8)" \
+            else np.float32
+
+        assert len(model_output.shape) == 2
+        assert len(model_input.shape) == 4
+        self.feature_dim = model_output.shape[-1]
+        self.image_shape = model_input.shape[1:]
+
+    def __call__(self, data_x, batch_size=32):
+        out = np.zeros((len(data_x), self.feature_dim), np.float32)
+        _run_in_batches(
+            lambda x: self.session.run([self.output_name], x)[0],
+            {self.input_name: np.asarray(data_x, self.input_dtype)}, out,
+            batch_size)
+        return out
+
+
+class OpenCVImageEncoder(object):
+    """Runs the re-ID network on the OpenCV DNN CPU backend.
+
+    Accepts an ONNX export or the frozen graph, as far as OpenCV supports
+    its layers. The network input layout is read from the patches, so
+    `image_shape` must match the input of the model.
+    """
+
+    def __init__(self, model_filename, image_shape=(128, 64, 3)):
+        self.net = cv2.dnn.readNet(model_filename)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.image_shape = list(image_shape)
+        self.feature_dim = self._forward(
+            np.zeros([1] + self.image_shape, np.uint8)).shape[-1]
+
+    def _forward(self, data_x):
+        self.net.setInput(np.asarray(data_x, np.float32))
+        return self.net.forward().reshape(len(data_x), -1)
+
+    def __call__(self, data_x, batch_size=32):
+        out = np.zeros((len(data_x), self.feature_dim), np.float32)
+        _run_in_batches(
+            lambda x: self._forward(x["images"]),
+            {"images": data_x}, out, batch_size)
+        return out
+
+
+class BoxEncoder(object):
+    """Computes the appearance features of bounding boxes in images.
 
-    def encoder(image, boxes):
-        image_patches = []
-        for box in boxes:
-            patch = extract_image_patch(image, box, image_shape[:2])
-            if patch is None:
-                print("WARNING: Failed to extract image patch: %s." % str(box))
-                patch = np.random.uniform(0., 255., image_shape).astype(np.uint8)
-            image_patches.append(patch)
-        image_patches = np.asarray(image_patches)
-        return image_encoder(image_patches, batch_size)
+    The patches of all boxes are encoded together. The batch size is chosen
+    from the number of boxes, so a frame takes as few session calls as
+    `max_batch_size` allows, split into batches of equal size.
 
-    return encoder
+    Parameters
+    ----------
+    image_encoder : ImageEncoder | ONNXImageEncoder
+        The re-ID network.
+    max_batch_size : int
+        Upper limit of the number of patches per session call.
+
+    """
+
+    def __init__(self, image_encoder, max_batch_size=128):
+        self.image_encoder = image_encoder
+        self.image_shape = list(image_encoder.image_shape)
+        self.max_batch_size = max(1, max_batch_size)
+        # Patch buffer reused between calls, grown to the largest crowd seen
+        self.patches = np.empty([0] + self.image_shape, np.uint8)
+
+    def __call__(self, image, boxes):
+        return self.encode_frames([image], [boxes])[0]
+
+    def encode_frames(self, images, boxes_list):
+        """Encode the boxes of several frames with shared session calls.
+
+        Returns one feature array per frame.
+        """
+        counts = [len(boxes) for boxes in boxes_list]
+        total = sum(counts)
+        if total > len(self.patches):
+            self.patches = np.empty([total] + self.image_shape, np.uint8)
+        offset = 0
+        for image, boxes, count in zip(images, boxes_list, counts):
+            if count == 0:
+                continue
+            patches, valid = extract_image_patches(
+                image, boxes, self.image_shape[:2],
+                self.patches[offset:offset + count])
+            for i in np.flatnonzero(~valid):
+                print("WARNING: Failed to extract image patch: %s." % str(boxes[i]))
+                patches[i] = np.random.uniform(
+                    0., 255., self.image_shape).astype(np.uint8)
+            offset += count
+
+        if total == 0:
+            features = np.zeros((0, self.image_encoder.feature_dim), np.float32)
+        else:
+            features = self.image_encoder(
+                self.patches[:total], self.batch_size(total))
+        return np.split(features, np.cumsum(counts)[:-1])
+
+    def batch_size(self, count):
+        """Size of equal batches that encode `count` patches in the fewest
+        session calls.
+        """
+        num_batches = -(-count // self.max_batch_size)
+        return -(-count // num_batches)
+
+
+ENCODER_BACKENDS = ("tensorflow", "onnxruntime", "opencv")
+
+
+def create_box_encoder(model_filename, input_name="images:0", output_name="features:0", batch_size=32, backend=None):
+    """Create a :class:`BoxEncoder` for the re-ID model.
+
+    `backend` is one of `tensorflow`, `onnxruntime` or `opencv`. If None it
+    is `onnxruntime` for `.onnx` files and `tensorflow` otherwise.
+    TensorFlow is only imported by the `tensorflow` backend. `batch_size`
+    is the upper limit of patches per session call.
+    """
+    if backend is None:
+        backend = "onnxruntime" if model_filename.endswith(".onnx") else "tensorflow"
+    if backend == "tensorflow":
+        image_encoder = ImageEncoder(model_filename, input_name, output_name)
+    elif backend == "onnxruntime":
+        image_encoder = ONNXImageEncoder(model_filename)
+    elif backend == "opencv":
+        image_encoder = OpenCVImageEncoder(model_filename)
+    else:
+        raise ValueError(
+            "Invalid encoder backend; must be one of %s" % ", ".join(ENCODER_BACKENDS))
+    return BoxEncoder(image_encoder, batch_size)
 
 
 def generate_detections(encoder, mot_dir, output_dir, detection_dir=None):
@@ -39,6 +39,39 @@ def iou(bbox, candidates):
     return area_intersection / (area_bbox + area_candidates - area_intersection)
 
 
+def iou_matrix(bboxes, candidates):
+    """Compute intersection over union between all pairs of boxes.
+
+    Parameters
+    ----------
+    bboxes : ndarray
+        A matrix of N bounding boxes (one per row) in format
+        `(top left x, top left y, width, height)`.
+    candidates : ndarray
+        A matrix of M candidate bounding boxes (one per row) in the same
+        format as `bboxes`.
+
+    Returns
+    -------
+    ndarray
+        Returns an NxM matrix, where element (i, j) is the intersection over
+        union in [0, 1] between `bboxes[i]` and `candidates[j]`.
+
+    """
+    bboxes_tl = bboxes[:, None, :2]
+    bboxes_br = bboxes_tl + bboxes[:, None, 2:]
+    candidates_tl = candidates[None, :, :2]
+    candidates_br = candidates_tl + candidates[None, :, 2:]
+
+    wh = np.maximum(0., np.minimum(bboxes_br, candidates_br) -
+                    np.maximum(bboxes_tl, candidates_tl))
+    area_intersection = wh.prod(axis=2)
+    area_bboxes = bboxes[:, 2:].prod(axis=1)
+    area_candidates = candidates[:, 2:].prod(axis=1)
+    return area_intersection / (
+        area_bboxes[:, None] + area_candidates[None, :] - area_intersection)
+
+
 def iou_cost(tracks, detections, track_indices=None,
              detection_indices=None):
     """An intersection over union distance metric.
@@ -69,13 +102,14 @@ def iou_cost(tracks, detections, track_indices=None,
     if detection_indices is None:
         detection_indices = np.arange(len(detections))
 
-    cost_matrix = np.zeros((len(track_indices), len(detection_indices)))
-    for row, track_idx in enumerate(track_indices):
-        if tracks[track_idx].time_since_update > 1:
-            cost_matrix[row, :] = linear_assignment.INFTY_COST
-            continue
+    bboxes = np.asarray(
+        [tracks[i].to_tlwh() for i in track_indices]).reshape(-1, 4)
+    candidates = np.asarray(
+        [detections[i].tlwh for i in detection_indices]).reshape(-1, 4)
+    cost_matrix = 1. - iou_matrix(bboxes, candidates)
 
-        bbox = tracks[track_idx].to_tlwh()
-        candidates = np.asarray([detections[i].tlwh for i in detection_indices])
-        cost_matrix[row, :] = 1. - iou(bbox, candidates)
+    # Tracks missed in the previous frame are not associated by overlap
+    missed = np.array(
+        [tracks[i].time_since_update > 1 for i in track_indices], dtype=bool)
+    cost_matrix[missed] = linear_assignment.INFTY_COST
     return cost_matrix
@@ -185,6 +185,104 @@ class KalmanFilter(object):
             kalman_gain, projected_cov, kalman_gain.T))
         return new_mean, new_covariance
 
+    def _motion_std(self, height):
+        # Process noise standard deviations of (N,) box heights, shape (N, 8)
+        height = np.asarray(height)
+        std = np.empty(height.shape + (8,))
+        std[..., [0, 1, 3]] = self._std_weight_position * height[..., None]
+        std[..., 2] = 1e-2
+        std[..., [4, 5, 7]] = self._std_weight_velocity * height[..., None]
+        std[..., 6] = 1e-5
+        return std
+
+    def multi_predict(self, mean, covariance):
+        """Run Kalman filter prediction step on a batch of states.
+
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean vectors of the object states at the
+            previous time step.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the object states at
+            the previous time step.
+
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the mean vectors and covariance matrices of the predicted
+            states.
+
+        """
+        motion_var = np.square(self._motion_std(mean[:, 3]))
+
+        mean = np.dot(mean, self._motion_mat.T)
+        covariance = np.matmul(
+            np.matmul(self._motion_mat, covariance), self._motion_mat.T)
+        diagonal = np.arange(2 * 4)
+        covariance[:, diagonal, diagonal] += motion_var
+        return mean, covariance
+
+    def multi_project(self, mean, covariance):
+        """Project a batch of state distributions to measurement space.
+
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean vectors of the states.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the states.
+
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the Nx4 projected means and Nx4x4 covariance matrices of
+            the given state estimates.
+
+        """
+        std = np.empty((len(mean), 4))
+        std[:, [0, 1, 3]] = self._std_weight_position * mean[:, 3:4]
+        std[:, 2] = 1e-1
+
+        # The observation model selects the first four state components
+        projected_mean = mean[:, :4]
+        projected_cov = covariance[:, :4, :4].copy()
+        diagonal = np.arange(4)
+        projected_cov[:, diagonal, diagonal] += np.square(std)
+        return projected_mean, projected_cov
+
+    def multi_update(self, mean, covariance, measurement):
+        """Run Kalman filter correction step on a batch of states.
+
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean vectors of the predicted states.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the states.
+        measurement : ndarray
+            The Nx4 dimensional measurement vectors (x, y, a, h), one per
+            state.
+
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the measurement-corrected state distributions.
+
+        """
+        projected_mean, projected_cov = self.multi_project(mean, covariance)
+
+        # Kalman gain K = P H^T S^-1, solved against the symmetric innovation
+        # covariance S instead of inverting it
+        kalman_gain = np.linalg.solve(
+            projected_cov, covariance[:, :4, :]).transpose(0, 2, 1)
+        innovation = measurement - projected_mean
+
+        new_mean = mean + np.einsum("nij,nj->ni", kalman_gain, innovation)
+        new_covariance = covariance - np.matmul(
+            np.matmul(kalman_gain, projected_cov), kalman_gain.transpose(0, 2, 1))
+        return new_mean, new_covariance
+
     def gating_distance(self, mean, covariance, measurements,
                         only_position=False):
         """Compute gating distance between state distribution and measurements.
@@ -227,3 +325,43 @@ class KalmanFilter(object):
             overwrite_b=True)
         squared_maha = np.sum(z * z, axis=0)
         return squared_maha
+
+    def multi_gating_distance(self, mean, covariance, measurements,
+                              only_position=False):
+        """Compute gating distances between a batch of state distributions
+        and measurements.
+
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean vectors of the state distributions.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the state
+            distributions.
+        measurements : ndarray
+            An Mx4 dimensional matrix of M measurements in format (x, y, a, h).
+        only_position : Optional[bool]
+            If True, distance computation is done with respect to the bounding
+            box center position only.
+
+        Returns
+        -------
+        ndarray
+            Returns an NxM matrix, where element (i, j) contains the squared
+            Mahalanobis distance between the i-th state distribution and
+            `measurements[j]`.
+
+        """
+        measurements = np.asarray(measurements).reshape(-1, 4)
+        if len(mean) == 0 or len(measurements) == 0:
+            return np.zeros((len(mean), len(measurements)))
+        mean, covariance = self.multi_project(mean, covariance)
+        if only_position:
+            mean, covariance = mean[:, :2], covariance[:, :2, :2]
+            measurements = measurements[:, :2]
+
+        cholesky_factor = np.linalg.cholesky(covariance)
+        d = measurements[None, :, :] - mean[:, None, :]
+        z = np.linalg.solve(cholesky_factor, d.transpose(0, 2, 1))
+        squared_maha = np.sum(z * z, axis=1)
+        return squared_maha
@@ -2,11 +2,95 @@
 from __future__ import absolute_import
 import numpy as np
 from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from . import kalman_filter
 
 
 INFTY_COST = 1e+5
 
+# Cost matrices with more entries than this are split into connected
+# components before solving, below it one dense solve is faster. The
+# matches are the same, but the unmatched entries come back in input order
+# rather than the dense solver's order, so new track ids can be handed out
+# in a different order
+DECOMPOSE_MIN_SIZE = 350 * 350
+
+
+def solve_components(cost_matrix, max_distance):
+    """Solve the assignment problem separately for each group of tracks and
+    detections that are linked by feasible associations.
+
+    Associations with cost larger than `max_distance` are never matched, so
+    the bipartite graph of the feasible ones splits into connected
+    components that can be solved independently, with the same matches as
+    one dense solve. Components with a single track or a single detection
+    are matched to their cheapest association directly, only the others are
+    passed to `linear_sum_assignment`.
+
+    Parameters
+    ----------
+    cost_matrix : ndarray
+        The NxM dimensional cost matrix.
+    max_distance : float
+        Gating threshold. Associations with cost larger than this value are
+        disregarded.
+
+    Returns
+    -------
+    (ndarray, ndarray)
+        Returns the row and column indices of the matches, sorted by row.
+
+    """
+    num_rows, num_cols = cost_matrix.shape
+    rows, cols = np.divmod(
+        np.flatnonzero(cost_matrix.ravel() <= max_distance), num_cols)
+    if len(rows) == 0:
+        return rows, cols
+
+    # Rows are nodes 0..N-1, columns nodes N..N+M-1
+    graph = coo_matrix(
+        (np.ones(len(rows)), (rows, num_rows + cols)),
+        shape=(num_rows + num_cols, num_rows + num_cols))
+    num_components, labels = connected_components(graph, directed=False)
+    row_labels, col_labels = labels[:num_rows], labels[num_rows:]
+    rows_per_label = np.bincount(row_labels, minlength=num_components)
+    cols_per_label = np.bincount(col_labels, minlength=num_components)
+
+    # A component with a single track or a single detection is a star, its
+    # cheapest association is the optimal one and needs no solver
+    edge_labels = row_labels[rows]
+    star = (rows_per_label[edge_labels] == 1) | \
+        (cols_per_label[edge_labels] == 1)
+    star_edges = np.flatnonzero(star)
+    star_edges = star_edges[np.lexsort((
+        cost_matrix[rows[star_edges], cols[star_edges]],
+        edge_labels[star_edges]))]
+    first = np.diff(edge_labels[star_edges], prepend=-1) != 0
+    matched_rows = [rows[star_edges[first]]]
+    matched_cols = [cols[star_edges[first]]]
+
+    # The remaining components are solved one by one
+    row_order = np.argsort(row_labels, kind="stable")
+    row_starts = np.cumsum(rows_per_label) - rows_per_label
+    col_order = np.argsort(col_labels, kind="stable")
+    col_starts = np.cumsum(cols_per_label) - cols_per_label
+    for label in np.unique(edge_labels[~star]):
+        component_rows = row_order[
+            row_starts[label]:row_starts[label] + rows_per_label[label]]
+        component_cols = col_order[
+            col_starts[label]:col_starts[label] + cols_per_label[label]]
+        component_cost = cost_matrix[np.ix_(component_rows, component_cols)]
+        r, c = linear_sum_assignment(component_cost)
+        feasible = component_cost[r, c] <= max_distance
+        matched_rows.append(component_rows[r[feasible]])
+        matched_cols.append(component_cols[c[feasible]])
+
+    matched_rows = np.concatenate(matched_rows)
+    matched_cols = np.concatenate(matched_cols)
+    order = np.argsort(matched_rows)
+    return matched_rows[order], matched_cols[order]
+
 
 def min_cost_matching(
         distance_metric, max_distance, tracks, detections, track_indices=None,
@@ -55,24 +139,41 @@ def min_cost_matching(
     cost_matrix = distance_metric(
         tracks, detections, track_indices, detection_indices)
     cost_matrix[cost_matrix > max_distance] = max_distance + 1e-5
-    indices = linear_sum_assignment(cost_matrix)
-    indices = np.asarray(indices)
-    indices = np.transpose(indices)
-    matches, unmatched_tracks, unmatched_detections = [], [], []
-    for col, detection_idx in enumerate(detection_indices):
-        if col not in indices[:, 1]:
-            unmatched_detections.append(detection_idx)
-    for row, track_idx in enumerate(track_indices):
-        if row not in indices[:, 0]:
-            unmatched_tracks.append(track_idx)
-    for row, col in indices:
-        track_idx = track_indices[row]
-        detection_idx = detection_indices[col]
-        if cost_matrix[row, col] > max_distance:
-            unmatched_tracks.append(track_idx)
-            unmatched_detections.append(detection_idx)
-        else:
-            matches.append((track_idx, detection_idx))
+    if cost_matrix.size < DECOMPOSE_MIN_SIZE:
+        rows, cols = linear_sum_assignment(cost_matrix)
+        assigned_rows = np.zeros(len(track_indices), dtype=bool)
+        assigned_rows[rows] = True
+        assigned_cols = np.zeros(len(detection_indices), dtype=bool)
+        assigned_cols[cols] = True
+        rejected = cost_matrix[rows, cols] > max_distance
+
+        # Unassigned entries first, then the assignments above the threshold
+        unmatched_detections = \
+            [detection_indices[col] for col in np.flatnonzero(~assigned_cols)] + \
+            [detection_indices[col] for col in cols[rejected]]
+        unmatched_tracks = \
+            [track_indices[row] for row in np.flatnonzero(~assigned_rows)] + \
+            [track_indices[row] for row in rows[rejected]]
+        matches = [
+            (track_indices[row], detection_indices[col])
+            for row, col in zip(rows[~rejected], cols[~rejected])]
+        return matches, unmatched_tracks, unmatched_detections
+
+    # Only feasible matches are solved for, the unmatched entries are
+    # returned in input order
+    rows, cols = solve_components(cost_matrix, max_distance)
+    matched_rows = np.zeros(len(track_indices), dtype=bool)
+    matched_rows[rows] = True
+    matched_cols = np.zeros(len(detection_indices), dtype=bool)
+    matched_cols[cols] = True
+
+    matches = [
+        (track_indices[row], detection_indices[col])
+        for row, col in zip(rows, cols)]
+    unmatched_tracks = [
+        track_indices[row] for row in np.flatnonzero(~matched_rows)]
+    unmatched_detections = [
+        detection_indices[col] for col in np.flatnonzero(~matched_cols)]
     return matches, unmatched_tracks, unmatched_detections
 
 
@@ -144,7 +245,7 @@ def matching_cascade(
 
 def gate_cost_matrix(
         kf, cost_matrix, tracks, detections, track_indices, detection_indices,
-        gated_cost=INFTY_COST, only_position=False):
+        gated_cost=INFTY_COST, only_position=False, gating_distance=None):
     """Invalidate infeasible entries in cost matrix based on the state
     distributions obtained by Kalman filtering.
 
@@ -172,6 +273,11 @@ def gate_cost_matrix(
     only_position : Optional[bool]
         If True, only the x, y position of the state distribution is considered
         during gating. Defaults to False.
+    gating_distance : Optional[ndarray]
+        Squared Mahalanobis distances between all `tracks` and all
+        `detections`, e.g. computed once per frame by
+        `kf.multi_gating_distance` and shared by the levels of the matching
+        cascade. If None, the distances of the given indices are computed.
 
     Returns
     -------
@@ -181,11 +287,15 @@ def gate_cost_matrix(
     """
     gating_dim = 2 if only_position else 4
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
-    measurements = np.asarray(
-        [detections[i].to_xyah() for i in detection_indices])
-    for row, track_idx in enumerate(track_indices):
-        track = tracks[track_idx]
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position)
-        cost_matrix[row, gating_distance > gating_threshold] = gated_cost
+    if gating_distance is None:
+        measurements = np.asarray(
+            [detections[i].to_xyah() for i in detection_indices])
+        gating_distance = kf.multi_gating_distance(
+            np.array([tracks[i].mean for i in track_indices]),
+            np.array([tracks[i].covariance for i in track_indices]),
+            measurements, only_position)
+    else:
+        gating_distance = gating_distance[
+            np.ix_(track_indices, detection_indices)]
+    cost_matrix[gating_distance > gating_threshold] = gated_cost
     return cost_matrix
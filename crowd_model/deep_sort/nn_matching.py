@@ -101,6 +101,13 @@ class NearestNeighborDistanceMetric(object):
     A nearest neighbor distance metric that, for each target, returns
     the closest distance to any sample that has been observed so far.
 
+    With a `budget`, the samples are kept in one contiguous float32 gallery
+    with a ring buffer of `budget` rows per target, so appending a sample
+    and evicting the oldest one are O(1). Without a budget, every target
+    keeps its own float32 array that doubles in size when it is full, so a
+    long lived target does not grow the storage of the others. For the
+    cosine metric the samples are stored normalized to unit length.
+
     Parameters
     ----------
     metric : str
@@ -111,16 +118,20 @@ class NearestNeighborDistanceMetric(object):
     budget : Optional[int]
         If not None, fix samples per class to at most this number. Removes
         the oldest samples when the budget is reached.
+    chunk_size : int
+        Maximum number of gallery samples compared in one matrix multiply.
+        Bounds the temporary memory of `distance` to `chunk_size` times the
+        number of query features.
 
     Attributes
     ----------
-    samples : Dict[int -> List[ndarray]]
-        A dictionary that maps from target identities to the list of samples
-        that have been observed so far.
+    samples : Dict[int -> ndarray]
+        A dictionary that maps from target identities to the samples that
+        have been observed so far. The arrays are views into the storage.
 
     """
 
-    def __init__(self, metric, matching_threshold, budget=None):
+    def __init__(self, metric, matching_threshold, budget=None, chunk_size=8192):
 
 
         if metric == "euclidean":
@@ -130,9 +141,67 @@ class NearestNeighborDistanceMetric(object):
         else:
             raise ValueError(
                 "Invalid metric; must be either 'euclidean' or 'cosine'")
+        self.normalize = metric == "cosine"
         self.matching_threshold = matching_threshold
         self.budget = budget
-        self.samples = {}
+        self.chunk_size = chunk_size
+
+        # Gallery of shape (slots, budget, feature dimensionality), allocated
+        # on the first sample, or the growing sample array of every slot
+        # without a budget
+        self._gallery = None
+        self._slot_samples = {}
+        self._counts = np.zeros(0, dtype=int)
+        self._heads = np.zeros(0, dtype=int)
+        self._slots = {}
+        self._free_slots = []
+
+    @property
+    def samples(self):
+        return {target: self._samples_of(slot)
+                for target, slot in self._slots.items()}
+
+    def _samples_of(self, slot):
+        if self.budget is None:
+            return self._slot_samples[slot][:self._counts[slot]]
+        return self._gallery[slot, :self._counts[slot]]
+
+    def _allocate(self, target, feature_dim):
+        if not self._free_slots:
+            # Double the number of slots
+            num_slots = len(self._counts)
+            new_slots = max(16, num_slots)
+            if self.budget is not None:
+                if self._gallery is None:
+                    self._gallery = np.zeros(
+                        (0, self.budget, feature_dim), np.float32)
+                self._gallery = np.concatenate((self._gallery, np.zeros(
+                    (new_slots,) + self._gallery.shape[1:], np.float32)))
+            self._counts = np.concatenate((self._counts, np.zeros(new_slots, dtype=int)))
+            self._heads = np.concatenate((self._heads, np.zeros(new_slots, dtype=int)))
+            self._free_slots = list(range(num_slots + new_slots - 1, num_slots - 1, -1))
+        slot = self._free_slots.pop()
+        if self.budget is None:
+            self._slot_samples[slot] = np.zeros((16, feature_dim), np.float32)
+        self._counts[slot] = 0
+        self._heads[slot] = 0
+        self._slots[target] = slot
+        return slot
+
+    def _append(self, slot, feature):
+        if self.budget is None:
+            samples = self._slot_samples[slot]
+            if self._counts[slot] == len(samples):
+                # Double the samples of this slot only
+                samples = self._slot_samples[slot] = np.concatenate(
+                    (samples, np.zeros_like(samples)))
+            samples[self._counts[slot]] = feature
+            self._counts[slot] += 1
+            return
+        self._gallery[slot, self._heads[slot]] = feature
+        # The head wraps around when the budget is reached, overwriting the oldest sample
+        self._heads[slot] = (self._heads[slot] + 1) % self.budget
+        self._counts[slot] = min(self._counts[slot] + 1, self.budget)
 
     def partial_fit(self, features, targets, active_targets):
         """Update the distance metric with new data.
@@ -147,11 +216,25 @@ class NearestNeighborDistanceMetric(object):
             A list of targets that are currently present in the scene.
 
         """
+        active_targets = set(active_targets)
+        # Release the slots of targets that left the scene
+        for target in [t for t in self._slots if t not in active_targets]:
+            slot = self._slots.pop(target)
+            self._slot_samples.pop(slot, None)
+            self._free_slots.append(slot)
+        if len(targets) == 0:
+            return
+
+        features = np.asarray(features, dtype=np.float32).reshape(len(targets), -1)
+        if self.normalize:
+            features = features / np.linalg.norm(features, axis=1, keepdims=True)
         for feature, target in zip(features, targets):
-            self.samples.setdefault(target, []).append(feature)
-            if self.budget is not None:
-                self.samples[target] = self.samples[target][-self.budget:]
-        self.samples = {k: self.samples[k] for k in active_targets}
+            if target not in active_targets:
+                continue
+            slot = self._slots.get(target)
+            if slot is None:
+                slot = self._allocate(target, features.shape[1])
+            self._append(slot, feature)
 
     def distance(self, features, targets):
         """Compute distance between features and targets.
@@ -172,6 +255,46 @@ class NearestNeighborDistanceMetric(object):
 
         """
         cost_matrix = np.zeros((len(targets), len(features)))
-        for i, target in enumerate(targets):
-            cost_matrix[i, :] = self._metric(self.samples[target], features)
+        if len(targets) == 0 or len(features) == 0:
+            return cost_matrix
+        features = np.asarray(features, dtype=np.float32)
+        if self.normalize:
+            features = features / np.linalg.norm(features, axis=1, keepdims=True)
+        else:
+            features_sq = np.square(features).sum(axis=1)
+
+        # Gather the samples of all targets into one matrix, grouped by target
+        slots = np.array([self._slots[target] for target in targets])
+        counts = self._counts[slots]
+        ends = np.cumsum(counts)
+        starts = ends - counts
+
+        # Split the targets into chunks of at most chunk_size samples, a
+        # single target larger than that is a chunk of its own
+        first = 0
+        while first < len(targets):
+            last = max(first + 1, np.searchsorted(
+                ends, starts[first] + self.chunk_size, side="right"))
+            if self.budget is None:
+                samples = np.concatenate(
+                    [self._samples_of(slot) for slot in slots[first:last]])
+            else:
+                rows = np.arange(starts[first], ends[last - 1])
+                row_slots = np.repeat(slots[first:last], counts[first:last])
+                samples = self._gallery[
+                    row_slots, rows - np.repeat(starts[first:last], counts[first:last])]
+
+            # Features by samples, so the per-target reduction runs along rows
+            products = np.dot(features, samples.T)
+            segments = starts[first:last] - starts[first]
+            if self.normalize:
+                # Nearest sample of every target is the most similar one
+                cost_matrix[first:last] = 1. - np.maximum.reduceat(
+                    products, segments, axis=1).T
+            else:
+                distances = -2. * products + np.square(samples).sum(axis=1)[None, :] \
+                    + features_sq[:, None]
+                cost_matrix[first:last] = np.maximum(0., np.minimum.reduceat(
+                    distances, segments, axis=1).T)
+            first = last
         return cost_matrix
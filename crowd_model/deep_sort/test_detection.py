@@ -0,0 +1,61 @@
+# vim: expandtab:ts=4:sw=4
+import numpy as np
+import pytest
+
+from deep_sort.detection import Detection, DetectionBatch
+from deep_sort.track import Track
+
+
+def _batch(rng, num_detections):
+    tlwh = np.c_[rng.uniform(0, 1000, (num_detections, 2)),
+                 rng.uniform(10, 100, (num_detections, 2))]
+    centroid = (tlwh[:, :2] + tlwh[:, 2:] / 2).astype(int)
+    return DetectionBatch(tlwh, rng.random(num_detections), centroid,
+                          rng.normal(size=(num_detections, 16)))
+
+
+def test_views_equal_standalone_detections():
+    rng = np.random.default_rng(0)
+    batch = _batch(rng, 5)
+    for i, view in enumerate(batch.detections()):
+        detection = Detection(batch.tlwh[i], batch.confidence[i],
+                              batch.centroid[i], batch.feature[i])
+        np.testing.assert_array_equal(view.tlwh, detection.tlwh)
+        assert view.confidence == detection.confidence
+        assert isinstance(view.confidence, float)
+        np.testing.assert_array_equal(view.centroid, detection.centroid)
+        np.testing.assert_array_equal(view.feature, detection.feature)
+        np.testing.assert_array_equal(view.to_tlbr(), detection.to_tlbr())
+        np.testing.assert_array_equal(view.to_xyah(), detection.to_xyah())
+
+
+def test_views_share_the_batch_arrays():
+    batch = _batch(np.random.default_rng(1), 3)
+    detections = batch.detections()
+    for detection in detections:
+        assert np.shares_memory(detection.tlwh, batch.tlwh)
+        assert np.shares_memory(detection.feature, batch.feature)
+        assert detection.feature.dtype == np.float32
+    # The box conversions return copies and leave the batch untouched
+    tlwh = batch.tlwh.copy()
+    for detection in detections:
+        detection.to_tlbr()
+        detection.to_xyah()
+    np.testing.assert_array_equal(batch.tlwh, tlwh)
+
+
+def test_empty_batch():
+    batch = DetectionBatch(np.zeros((0, 4)), np.zeros(0), np.zeros((0, 2)),
+                           np.zeros((0, 16)))
+    assert len(batch) == 0
+    assert batch.detections() == []
+
+
+def test_detection_and_track_have_slots():
+    detection = Detection([0., 0., 10., 20.], 0.9, [5, 10], np.zeros(4))
+    with pytest.raises(AttributeError):
+        detection.class_name = "person"
+    track = Track(np.zeros(8), np.eye(8), 1, 0, [5, 10], 3, 30)
+    with pytest.raises(AttributeError):
+        track.label = "person"
+    assert track.positions.dtype == np.int32
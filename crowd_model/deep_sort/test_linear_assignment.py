@@ -0,0 +1,141 @@
+# vim: expandtab:ts=4:sw=4
+import numpy as np
+import pytest
+from scipy.optimize import linear_sum_assignment
+
+from deep_sort import linear_assignment
+from deep_sort import nn_matching
+from deep_sort.detection import Detection
+from deep_sort.tracker import Tracker
+
+
+def _reference_min_cost_matching(cost_matrix, max_distance, track_indices,
+                                 detection_indices):
+    # The original per-entry bookkeeping, which defines the output order
+    cost_matrix = cost_matrix.copy()
+    cost_matrix[cost_matrix > max_distance] = max_distance + 1e-5
+    indices = np.transpose(np.asarray(linear_sum_assignment(cost_matrix)))
+    matches, unmatched_tracks, unmatched_detections = [], [], []
+    for col, detection_idx in enumerate(detection_indices):
+        if col not in indices[:, 1]:
+            unmatched_detections.append(detection_idx)
+    for row, track_idx in enumerate(track_indices):
+        if row not in indices[:, 0]:
+            unmatched_tracks.append(track_idx)
+    for row, col in indices:
+        track_idx = track_indices[row]
+        detection_idx = detection_indices[col]
+        if cost_matrix[row, col] > max_distance:
+            unmatched_tracks.append(track_idx)
+            unmatched_detections.append(detection_idx)
+        else:
+            matches.append((track_idx, detection_idx))
+    return matches, unmatched_tracks, unmatched_detections
+
+
+def _random_costs(rng, num_rows, num_cols):
+    density = rng.uniform(0.05, 0.6)
+    return np.where(rng.random((num_rows, num_cols)) < density,
+                    rng.random((num_rows, num_cols)),
+                    linear_assignment.INFTY_COST)
+
+
+def _match(cost_matrix, max_distance, track_indices, detection_indices):
+    def metric(tracks, detections, track_indices_, detection_indices_):
+        return cost_matrix.copy()
+    return linear_assignment.min_cost_matching(
+        metric, max_distance, None, None, track_indices, detection_indices)
+
+
+def test_dense_path_keeps_original_order():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        num_rows, num_cols = rng.integers(1, 30, 2)
+        cost_matrix = _random_costs(rng, num_rows, num_cols)
+        track_indices = list(rng.permutation(100)[:num_rows])
+        detection_indices = list(rng.permutation(100)[:num_cols])
+        assert _match(cost_matrix, 0.5, track_indices, detection_indices) == \
+            _reference_min_cost_matching(
+                cost_matrix, 0.5, track_indices, detection_indices)
+
+
+def test_dense_path_puts_rejected_assignments_last():
+    # Track 0 only fits detection 2, track 1 fits nothing, so the solver
+    # assigns it to an infeasible detection that is rejected afterwards
+    cost_matrix = np.array([
+        [9., 9., 0.1],
+        [9., 9., 9.]])
+    matches, unmatched_tracks, unmatched_detections = _match(
+        cost_matrix, 0.5, [10, 11], [20, 21, 22])
+    rows, cols = linear_sum_assignment(np.minimum(cost_matrix, 0.5 + 1e-5))
+    rejected_col = cols[rows == 1][0]
+    assert matches == [(10, 22)]
+    assert unmatched_tracks == [11]
+    assert unmatched_detections == \
+        [20 + c for c in (0, 1) if c != rejected_col] + [20 + rejected_col]
+
+
+def test_component_path_matches_dense_solver(monkeypatch):
+    monkeypatch.setattr(linear_assignment, "DECOMPOSE_MIN_SIZE", 0)
+    rng = np.random.default_rng(1)
+    for _ in range(500):
+        num_rows, num_cols = rng.integers(1, 30, 2)
+        cost_matrix = _random_costs(rng, num_rows, num_cols)
+        track_indices = list(range(num_rows))
+        detection_indices = list(range(num_cols))
+        matches, unmatched_tracks, unmatched_detections = _match(
+            cost_matrix, 0.5, track_indices, detection_indices)
+        expected = _reference_min_cost_matching(
+            cost_matrix, 0.5, track_indices, detection_indices)
+        assert sorted(matches) == sorted(expected[0])
+        # Unmatched entries come back in input order
+        assert unmatched_tracks == sorted(expected[1])
+        assert unmatched_detections == sorted(expected[2])
+
+
+def test_solve_components_matches_dense_solver():
+    rng = np.random.default_rng(2)
+    for _ in range(1000):
+        num_rows, num_cols = rng.integers(1, 40, 2)
+        max_distance = rng.uniform(0.2, 1.)
+        cost_matrix = _random_costs(rng, num_rows, num_cols)
+        cost_matrix[cost_matrix > max_distance] = max_distance + 1e-5
+        rows, cols = linear_sum_assignment(cost_matrix)
+        feasible = cost_matrix[rows, cols] <= max_distance
+        component_rows, component_cols = linear_assignment.solve_components(
+            cost_matrix, max_distance)
+        assert list(component_rows) == sorted(component_rows)
+        assert set(zip(rows[feasible], cols[feasible])) == \
+            set(zip(component_rows, component_cols))
+
+
+@pytest.mark.parametrize("decompose_min_size", [0, 350 * 350])
+def test_tracker_ids_follow_detection_order(monkeypatch, decompose_min_size):
+    monkeypatch.setattr(
+        linear_assignment, "DECOMPOSE_MIN_SIZE", decompose_min_size)
+    metric = nn_matching.NearestNeighborDistanceMetric("cosine", 0.2, 10)
+    tracker = Tracker(metric, n_init=1)
+    rng = np.random.default_rng(3)
+    boxes = np.array([[10., 10., 20., 50.], [200., 10., 20., 50.],
+                      [400., 10., 20., 50.]])
+    features = rng.normal(size=(3, 16))
+
+    def detections(indices):
+        return [Detection(boxes[i], 0.9, boxes[i, :2].astype(int), features[i])
+                for i in indices]
+
+    tracker.predict()
+    tracker.update(detections([0, 1, 2]), 0)
+    assert [t.track_id for t in tracker.tracks] == [1, 2, 3]
+
+    # Detection 1 keeps its track, the new people get ids in detection order
+    new_boxes = np.array([[600., 10., 20., 50.], [800., 10., 20., 50.]])
+    boxes = np.vstack((boxes[[1]], new_boxes))
+    features = np.vstack((features[[1]], rng.normal(size=(2, 16))))
+    tracker.predict()
+    tracker.update(detections([1, 0, 2]), 1)
+    ids = {t.track_id: t.to_tlwh()[0] for t in tracker.tracks
+           if t.time_since_update == 0}
+    assert np.isclose(ids[2], 200., atol=1.)
+    assert np.isclose(ids[4], 600., atol=1.)
+    assert np.isclose(ids[5], 800., atol=1.)
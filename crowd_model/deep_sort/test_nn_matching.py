@@ -0,0 +1,55 @@
+# vim: expandtab:ts=4:sw=4
+import numpy as np
+import pytest
+
+from deep_sort import nn_matching
+
+
+def _observe(metric, rng, num_frames, lifetimes):
+    # Targets observed once per frame while alive, the reference keeps every
+    # sample in plain lists like the original metric
+    reference = {}
+    for frame in range(num_frames):
+        targets = [t for t, (start, end) in lifetimes.items()
+                   if start <= frame < end]
+        features = rng.normal(size=(len(targets), 8))
+        metric.partial_fit(features, np.array(targets, dtype=int), targets)
+        reference = {t: reference.get(t, []) for t in targets}
+        for feature, target in zip(features, targets):
+            reference[target].append(feature)
+            if metric.budget is not None:
+                reference[target] = reference[target][-metric.budget:]
+    return reference
+
+
+@pytest.mark.parametrize("budget", [None, 5])
+@pytest.mark.parametrize("name", ["cosine", "euclidean"])
+def test_distance_matches_brute_force(budget, name):
+    rng = np.random.default_rng(0)
+    metric = nn_matching.NearestNeighborDistanceMetric(
+        name, 0.5, budget, chunk_size=7)
+    lifetimes = {1: (0, 60), 2: (0, 10), 3: (5, 40), 4: (30, 60), 5: (45, 60)}
+    reference = _observe(metric, rng, 60, lifetimes)
+
+    queries = rng.normal(size=(4, 8))
+    targets = sorted(reference)
+    distance = nn_matching._nn_cosine_distance if name == "cosine" \
+        else nn_matching._nn_euclidean_distance
+    expected = np.array([distance(np.array(reference[t]), queries)
+                         for t in targets])
+    np.testing.assert_allclose(
+        metric.distance(queries, targets), expected, rtol=1e-4, atol=1e-4)
+    assert {t: len(s) for t, s in metric.samples.items()} == \
+        {t: len(s) for t, s in reference.items()}
+
+
+def test_unbounded_targets_grow_separately():
+    rng = np.random.default_rng(1)
+    metric = nn_matching.NearestNeighborDistanceMetric("cosine", 0.5, None)
+    # One long lived target among many short ones
+    lifetimes = {1: (0, 200)}
+    lifetimes.update({t: (t, t + 10) for t in range(2, 200)})
+    _observe(metric, rng, 200, lifetimes)
+    capacities = sorted(
+        len(samples) for samples in metric._slot_samples.values())
+    assert capacities == [16] * 10 + [256]
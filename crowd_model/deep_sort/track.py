@@ -1,4 +1,5 @@
 # vim: expandtab:ts=4:sw=4
+import numpy as np
 
 
 class TrackState:
@@ -17,6 +18,70 @@ class TrackState:
     Recorded = 4
 
 
+class TrackStateStore:
+    """
+    Kalman filter states of a set of tracks, stacked into shared arrays so
+    that the filter steps run on all tracks at once.
+
+    Each track owns a slot of the store, its `mean` and `covariance` are
+    views into the arrays. Slots of removed tracks are reused, and the
+    arrays double in size when no slot is free.
+
+    Parameters
+    ----------
+    capacity : int
+        Number of slots allocated up front.
+
+    Attributes
+    ----------
+    mean : ndarray
+        The Nx8 dimensional mean vectors, one per slot.
+    covariance : ndarray
+        The Nx8x8 dimensional covariance matrices, one per slot.
+
+    """
+
+    def __init__(self, capacity=64):
+        self.mean = np.zeros((capacity, 8))
+        self.covariance = np.zeros((capacity, 8, 8))
+        self._free_slots = list(range(capacity - 1, -1, -1))
+
+    def allocate(self):
+        """Reserve a slot and return its index."""
+        if not self._free_slots:
+            # Double the number of slots
+            num_slots = len(self.mean)
+            new_slots = max(1, num_slots)
+            self.mean = np.concatenate((self.mean, np.zeros((new_slots, 8))))
+            self.covariance = np.concatenate(
+                (self.covariance, np.zeros((new_slots, 8, 8))))
+            self._free_slots = list(range(num_slots + new_slots - 1, num_slots - 1, -1))
+        return self._free_slots.pop()
+
+    def release(self, slot):
+        """Return a slot to the store."""
+        self._free_slots.append(slot)
+
+    def predict(self, kf, slots):
+        """Run the Kalman filter prediction step on the states of `slots`."""
+        if len(slots) == 0:
+            return
+        slots = np.asarray(slots)
+        self.mean[slots], self.covariance[slots] = kf.multi_predict(
+            self.mean[slots], self.covariance[slots])
+
+    def update(self, kf, slots, measurements):
+        """Run the Kalman filter correction step on the states of `slots`,
+        with one `(x, y, a, h)` measurement per slot.
+        """
+        if len(slots) == 0:
+            return
+        slots = np.asarray(slots)
+        self.mean[slots], self.covariance[slots] = kf.multi_update(
+            self.mean[slots], self.covariance[slots],
+            np.asarray(measurements).reshape(len(slots), 4))
+
+
 class Track:
     """
     A single target track with state space `(x, y, a, h)` and associated
@@ -41,13 +106,17 @@ class Track:
     feature : Optional[ndarray]
         Feature vector of the detection this track originates from. If not None,
         this feature is added to the `features` cache.
+    store : Optional[TrackStateStore]
+        The store that holds the state distribution. If None, the track keeps
+        it in a store of its own.
 
     Attributes
     ----------
     mean : ndarray
-        Mean vector of the initial state distribution.
+        Mean vector of the current state distribution, a view into the store.
     covariance : ndarray
-        Covariance matrix of the initial state distribution.
+        Covariance matrix of the current state distribution, a view into the
+        store.
     track_id : int
         A unique track identifier.
     hits : int
@@ -61,11 +130,21 @@ class Track:
     features : List[ndarray]
         A cache of features. On each measurement update, the associated feature
         vector is added to this list.
+    positions : ndarray
+        The Nx2 movement trail of the track, recorded by centroids. Older
+        positions may have been taken out with `pop_positions`.
 
     """
 
+    __slots__ = (
+        "_store", "_slot", "track_id", "hits", "age", "time_since_update",
+        "state", "features", "_n_init", "_max_age", "_positions",
+        "_num_positions", "entry", "exit")
+
     def __init__(self, mean, covariance, track_id, entry, position, n_init, 
-        max_age, feature=None):
+        max_age, feature=None, store=None):
+        self._store = store if store is not None else TrackStateStore(1)
+        self._slot = self._store.allocate()
         self.mean = mean
         self.covariance = covariance
         self.track_id = track_id
@@ -81,13 +160,64 @@ class Track:
         self._n_init = n_init
         self._max_age = max_age
 
-        # Movement trails, recorded by centroids
-        self.positions = [position]
+        # Movement trails, recorded by centroids into an array that doubles
+        # in size when it is full
+        self._positions = np.zeros((16, 2), dtype=np.int32)
+        self._num_positions = 0
+        self._append_position(position)
 
         # Initial detection
         self.entry = entry
         self.exit = None
 
+    @property
+    def mean(self):
+        return self._store.mean[self._slot]
+
+    @mean.setter
+    def mean(self, mean):
+        self._store.mean[self._slot] = mean
+
+    @property
+    def covariance(self):
+        return self._store.covariance[self._slot]
+
+    @covariance.setter
+    def covariance(self, covariance):
+        self._store.covariance[self._slot] = covariance
+
+    @property
+    def positions(self):
+        return self._positions[:self._num_positions]
+
+    def _append_position(self, position):
+        if self._num_positions == len(self._positions):
+            self._positions = np.concatenate(
+                (self._positions, np.zeros_like(self._positions)))
+        self._positions[self._num_positions] = position
+        self._num_positions += 1
+
+    def pop_positions(self, count):
+        """Remove the oldest `count` positions from the movement trail and
+        return them.
+        """
+        popped = self._positions[:count].copy()
+        remaining = self._num_positions - count
+        self._positions[:remaining] = self._positions[count:self._num_positions]
+        self._num_positions = remaining
+        return popped
+
+    def detach(self):
+        """Move the state distribution out of the shared store into a store
+        of its own and free the slot, e.g. when the track is removed.
+        """
+        store = TrackStateStore(1)
+        slot = store.allocate()
+        store.mean[slot] = self.mean
+        store.covariance[slot] = self.covariance
+        self._store.release(self._slot)
+        self._store, self._slot = store, slot
+
     def to_tlwh(self):
         """Get current position in bounding box format `(top left x, top left y,
         width, height)`.
@@ -128,9 +258,39 @@ class Track:
 
         """
         self.mean, self.covariance = kf.predict(self.mean, self.covariance)
+        self.mark_predicted()
+
+    def mark_predicted(self):
+        """Count a prediction step whose state was propagated by the caller,
+        e.g. by `TrackStateStore.predict` for all tracks at once.
+        """
         self.age += 1
         self.time_since_update += 1
 
+    def coast(self, kf):
+        """Propagate the state distribution to the current time step on a
+        frame without detections, e.g. between detector keyframes.
+
+        Unlike `predict`, this does not count as a missed frame. Tracks that
+        were observed at the last update extend their movement trail with the
+        predicted centroid.
+
+        Parameters
+        ----------
+        kf : kalman_filter.KalmanFilter
+            The Kalman filter.
+
+        """
+        self.mean, self.covariance = kf.predict(self.mean, self.covariance)
+        self.mark_coasted()
+
+    def mark_coasted(self):
+        """Count a coasting step whose state was propagated by the caller.
+        """
+        self.age += 1
+        if self.time_since_update == 0:
+            self._append_position(self.mean[:2].astype(int))
+
     def update(self, kf, detection):
         """Perform Kalman filter measurement update step and update the feature
         cache.
@@ -145,8 +305,20 @@ class Track:
         """
         self.mean, self.covariance = kf.update(
             self.mean, self.covariance, detection.to_xyah())
+        self.mark_updated(detection)
+
+    def mark_updated(self, detection):
+        """Record the associated detection of a measurement update whose
+        state was corrected by the caller.
+
+        Parameters
+        ----------
+        detection : Detection
+            The associated detection.
+
+        """
         self.features.append(detection.feature)
-        self.positions.append(detection.centroid)
+        self._append_position(detection.centroid)
 
         self.hits += 1
         self.time_since_update = 0
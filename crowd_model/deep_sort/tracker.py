@@ -4,7 +4,7 @@ import numpy as np
 from . import kalman_filter
 from . import linear_assignment
 from . import iou_matching
-from .track import Track
+from .track import Track, TrackStateStore
 
 
 class Tracker:
@@ -34,6 +34,9 @@ class Tracker:
         A Kalman filter to filter target trajectories in image space.
     tracks : List[Track]
         The list of active tracks at the current time step.
+    store : TrackStateStore
+        The Kalman filter states of the active tracks, which are filtered in
+        one batch per step.
 
     """
 
@@ -45,6 +48,7 @@ class Tracker:
 
         self.kf = kalman_filter.KalmanFilter()
         self.tracks = []
+        self.store = TrackStateStore()
         self._next_id = 1
 
     def predict(self):
@@ -52,8 +56,21 @@ class Tracker:
 
         This function should be called once every time step, before `update`.
         """
+        self.store.predict(self.kf, [t._slot for t in self.tracks])
         for track in self.tracks:
-            track.predict(self.kf)
+            track.mark_predicted()
+
+    def coast(self):
+        """Propagate track state distributions one time step forward on a
+        frame that is not run through the detector.
+
+        Coasting steps do not count towards `max_age`, so between keyframes
+        the tracks keep their state and are only advanced by the motion
+        model.
+        """
+        self.store.predict(self.kf, [t._slot for t in self.tracks])
+        for track in self.tracks:
+            track.mark_coasted()
 
     def update(self, detections, time):
         """Perform measurement update and track management.
@@ -68,8 +85,11 @@ class Tracker:
         matches, unmatched_tracks, unmatched_detections = self._match(detections)
 
         # Update track set.
+        self.store.update(
+            self.kf, [self.tracks[track_idx]._slot for track_idx, _ in matches],
+            [detections[detection_idx].to_xyah() for _, detection_idx in matches])
         for track_idx, detection_idx in matches:
-            self.tracks[track_idx].update(self.kf, detections[detection_idx])
+            self.tracks[track_idx].mark_updated(detections[detection_idx])
         for track_idx in unmatched_tracks:
             self.tracks[track_idx].mark_missed()
         for detection_idx in unmatched_detections:
@@ -79,6 +99,9 @@ class Tracker:
             if t.is_recorded():
                 t.exit = time
                 expired.append(t)
+            if t.is_deleted() or t.is_recorded():
+                # Free the slot, expired tracks keep a copy of their state
+                t.detach()
         self.tracks = [t for t in self.tracks if not t.is_deleted() and not t.is_recorded()]
 
         # Update distance metric.
@@ -96,6 +119,12 @@ class Tracker:
         return expired
 
     def _match(self, detections):
+        # Gating distances of all tracks to all detections, computed in one
+        # batch and shared by all levels of the matching cascade
+        slots = [t._slot for t in self.tracks]
+        gating_distance = self.kf.multi_gating_distance(
+            self.store.mean[slots], self.store.covariance[slots],
+            [d.to_xyah() for d in detections])
 
         def gated_metric(tracks, dets, track_indices, detection_indices):
             features = np.array([dets[i].feature for i in detection_indices])
@@ -103,7 +132,7 @@ class Tracker:
             cost_matrix = self.metric.distance(features, targets)
             cost_matrix = linear_assignment.gate_cost_matrix(
                 self.kf, cost_matrix, tracks, dets, track_indices,
-                detection_indices)
+                detection_indices, gating_distance=gating_distance)
 
             return cost_matrix
 
@@ -139,5 +168,5 @@ class Tracker:
         mean, covariance = self.kf.initiate(detection.to_xyah())
         self.tracks.append(Track(
             mean, covariance, self._next_id, time, detection.centroid, self.n_init, 
-            self.max_age, detection.feature))
+            self.max_age, detection.feature, self.store))
         self._next_id += 1
@@ -0,0 +1,268 @@
+import numpy as np
+import cv2
+from config import MIN_CONF, NMS_THRESH
+from roi import RegionOfInterest
+
+def decode_detections(layer_outputs, frame_width, frame_height):
+	# Stack all YOLO output layers into one (rows, 5 + classes) array
+	detections = np.concatenate([output.reshape(-1, output.shape[-1]) for output in layer_outputs])
+	# Class ID for person is 0, keep rows whose person score meets threshold
+	candidates = detections[detections[:, 5] > MIN_CONF]
+	# Person must also be the top scoring class (argmax picks the first index on ties)
+	scores = candidates[:, 5:]
+	candidates = candidates[scores[:, 0] >= scores.max(axis=1)]
+
+	# Scale the bounding box coordinates back to the size of the image
+	box = candidates[:, 0:4] * np.array([frame_width, frame_height, frame_width, frame_height])
+	box = box.astype("int")
+	centroids = box[:, 0:2]
+	sizes = box[:, 2:4]
+	# Derive the coordinates for the top left corner of the bounding box
+	top_left = (centroids - sizes / 2).astype("int")
+	boxes = np.hstack((top_left, sizes))
+	confidences = candidates[:, 5].astype(float)
+	return boxes, centroids, confidences
+
+def tile_rects(frame_width, frame_height, grid, overlap):
+	"""Split a frame into a `(columns, rows)` grid of tiles that overlap their
+	neighbours by the fraction `overlap` of the tile size. Returns the tiles
+	as `(x, y, w, h)` rectangles.
+	"""
+	rects = []
+	for count, size in zip(grid, (frame_width, frame_height)):
+		# Tile size so that `count` tiles with the given overlap span the frame exactly
+		tile = size / (count - (count - 1) * overlap)
+		starts = np.round(np.arange(count) * tile * (1 - overlap)).astype(int)
+		rects.append([(int(start), min(size, int(round(start + tile))) - int(start)) for start in starts])
+	return [(x, y, w, h) for (y, h) in rects[1] for (x, w) in rects[0]]
+
+def _suppress(boxes, centroids, confidences):
+	# Perform Non-maxima suppression to suppress weak and overlapping boxes
+	# It will filter out unnecessary boxes, i.e. box within box
+	# Output will be indexs of useful boxes
+	idxs = cv2.dnn.NMSBoxes(boxes.tolist(), confidences.tolist(), MIN_CONF, NMS_THRESH)
+	keep = np.sort(np.asarray(idxs, dtype=int).flatten())
+	return boxes[keep], centroids[keep], confidences[keep]
+
+
+class Detector(object):
+	"""
+	Base class for the YOLO person detector engines.
+
+	Subclasses load a model in `load` and implement `_forward`, which runs
+	one batch of frames and returns the raw YOLO rows of every frame. Box
+	decoding and non-maxima suppression are shared by all engines.
+
+	Parameters
+	----------
+	config : Dict[str -> Any]
+		The `YOLO_CONFIG` dictionary.
+	roi : Optional[List[List[(float, float)]]]
+		Region of interest polygons. If given, only crops that cover them are
+		detected on, and persons outside them are dropped.
+
+	"""
+
+	def __init__(self, config, roi=None):
+		self.config = config
+		self.roi = RegionOfInterest(roi) if roi else None
+		self.input_size = config.get("INPUT_SIZE", 416)
+		self.tile_grid = tuple(config.get("TILE_GRID", (1, 1)))
+		self.tile_overlap = config.get("TILE_OVERLAP", 0.2)
+		self.tile_full_frame = config.get("TILE_FULL_FRAME", True)
+		self.blob = None
+
+	def load(self):
+		"""Load the model into memory."""
+		raise NotImplementedError
+
+	def warm_up(self, runs=1):
+		"""Run a few passes on a blank frame so lazy allocations and kernel
+		selection happen before the first real frame.
+		"""
+		frame = np.zeros((self.input_size, self.input_size, 3), dtype=np.uint8)
+		for _ in range(runs):
+			self.infer([frame])
+
+	def infer(self, frames):
+		"""Detect persons in a batch of frames.
+
+		Returns a list with one `(boxes, centroids, confidences)` tuple per
+		frame, in input order. Boxes are in format `(x, y, w, h)`.
+		"""
+		if self.roi is not None or self.tile_grid != (1, 1):
+			results = self.infer_crops(frames, [self._crops(frame) for frame in frames])
+			if self.roi is not None:
+				results = [self._inside_roi(frame, *detections) for frame, detections in zip(frames, results)]
+			return results
+		results = []
+		for frame, layer_outputs in zip(frames, self._forward(frames)):
+			(frame_height, frame_width) = frame.shape[:2]
+			detections = decode_detections(layer_outputs, frame_width, frame_height)
+			results.append(_suppress(*detections))
+		return results
+
+	def infer_crops(self, frames, crops):
+		"""Detect persons in rectangular crops of a batch of frames.
+
+		`crops` holds a list of `(x, y, w, h)` rectangles for every frame. All
+		crops of all frames go through the network in one forward pass. The
+		boxes are mapped back to frame coordinates and merged per frame with
+		non-maxima suppression, so persons on the border of two overlapping
+		crops are only reported once.
+		"""
+		images = [frame[y:y + h, x:x + w] for frame, rects in zip(frames, crops) for (x, y, w, h) in rects]
+		outputs = iter(self._forward(images)) if images else iter([])
+		results = []
+		for rects in crops:
+			detections = [(np.zeros((0, 4), dtype=int), np.zeros((0, 2), dtype=int), np.zeros(0))]
+			for (x, y, w, h) in rects:
+				(boxes, centroids, confidences) = decode_detections(next(outputs), w, h)
+				# Shift the crop coordinates back into the frame
+				detections.append((boxes + (x, y, 0, 0), centroids + (x, y), confidences))
+			results.append(_suppress(*[np.concatenate(parts) for parts in zip(*detections)]))
+		return results
+
+	def _inside_roi(self, frame, boxes, centroids, confidences):
+		# Drop persons whose centroid lies outside the region of interest
+		(frame_height, frame_width) = frame.shape[:2]
+		inside = self.roi.contains(centroids, frame_width, frame_height)
+		return boxes[inside], centroids[inside], confidences[inside]
+
+	def _crops(self, frame):
+		(frame_height, frame_width) = frame.shape[:2]
+		regions = [(0, 0, frame_width, frame_height)]
+		if self.roi is not None:
+			regions = self.roi.crops(frame_width, frame_height)
+		if self.tile_grid == (1, 1):
+			return regions
+		rects = []
+		for (x, y, w, h) in regions:
+			rects += [(x + tile_x, y + tile_y, tile_w, tile_h) for (tile_x, tile_y, tile_w, tile_h)
+				in tile_rects(w, h, self.tile_grid, self.tile_overlap)]
+			if self.tile_full_frame:
+				# The whole region at low resolution still finds the persons too large for a single tile
+				rects.append((x, y, w, h))
+		return rects
+
+	def preprocess(self, frames):
+		"""Build the 4-D input blob of a batch of frames.
+
+		Every frame is resized straight from its decoded size into a buffer
+		that is reused between calls, then swapped to RGB and scaled to [0, 1]
+		in place. The returned blob is only valid until the next call.
+		"""
+		size = self.input_size
+		if self.blob is None or len(self.blob) < len(frames) or self.blob.shape[-1] != size:
+			self.blob = np.empty((len(frames), 3, size, size), dtype=np.float32)
+			self.resized = np.empty((size, size, 3), dtype=np.uint8)
+		for i, frame in enumerate(frames):
+			cv2.resize(frame, (size, size), dst=self.resized, interpolation=cv2.INTER_LINEAR)
+			np.multiply(self.resized[:, :, ::-1].transpose(2, 0, 1), 1 / 255.0, out=self.blob[i])
+		return self.blob[:len(frames)]
+
+	def _forward(self, frames):
+		raise NotImplementedError
+
+
+class OpenCVDetector(Detector):
+	"""YOLO Darknet weights run on the OpenCV DNN CPU backend."""
+
+	def load(self):
+		# Load the YOLO pre-trained COCO dataset
+		self.net = cv2.dnn.readNetFromDarknet(self.config["CONFIG_PATH"], self.config["WEIGHTS_PATH"])
+		# Set the preferable backend to CPU since we are not using GPU
+		self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+		self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+		# Get the names of all the layers in the network
+		ln = self.net.getLayerNames()
+		# Filter out the layer names we dont need for YOLO
+		self.ln = [ln[i - 1] for i in np.asarray(self.net.getUnconnectedOutLayers()).flatten()]
+
+	def _forward(self, frames):
+		# Perform a single forward pass of YOLO for the whole batch
+		self.net.setInput(self.preprocess(frames))
+		layer_outputs = self.net.forward(self.ln)
+		# Split every output layer into per frame rows, in input order
+		layer_outputs = [output.reshape(len(frames), -1, output.shape[-1]) for output in layer_outputs]
+		return [[output[i] for output in layer_outputs] for i in range(len(frames))]
+
+
+class ONNXRuntimeDetector(Detector):
+	"""
+	An exported YOLO ONNX model run on the ONNX Runtime CPU provider.
+
+	Two output layouts are understood: raw YOLO rows of shape
+	`(batch, rows, 5 + classes)`, and the `boxes` / `confs` pair of shape
+	`(batch, rows, 1, 4)` / `(batch, rows, classes)` written by common
+	YOLOv4 PyTorch exporters, with corner coordinates normalized to [0, 1].
+
+	"""
+
+	def load(self):
+		import onnxruntime as ort
+
+		options = ort.SessionOptions()
+		options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+		if self.config.get("THREADS"):
+			options.intra_op_num_threads = self.config["THREADS"]
+		self.session = ort.InferenceSession(
+			self.config["ONNX_PATH"], options, providers=["CPUExecutionProvider"])
+		model_input = self.session.get_inputs()[0]
+		self.input_name = model_input.name
+		# Static input sizes in the exported graph take precedence over the config
+		if isinstance(model_input.shape[-1], int):
+			self.input_size = model_input.shape[-1]
+		# A static batch dimension, e.g. 1 in most YOLO exports, fixes the number of images per run
+		self.model_batch_size = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+		self.output_names = [output.name for output in self.session.get_outputs()]
+
+	def _forward(self, frames):
+		size = self.model_batch_size
+		if size is None or len(frames) == size:
+			return self._run(frames)
+		# Split tiles, crops and frame batches into runs the model accepts
+		results = []
+		for start in range(0, len(frames), size):
+			run = list(frames[start:start + size])
+			# Fill the last run up with copies of its last image, their rows are dropped
+			results += self._run(run + run[-1:] * (size - len(run)))[:len(run)]
+		return results
+
+	def _run(self, frames):
+		outputs = self.session.run(self.output_names, {self.input_name: self.preprocess(frames)})
+		if len(outputs) == 2 and outputs[0].shape[-1] == 4:
+			outputs = [self._to_yolo_rows(*outputs)]
+		outputs = [output.reshape(len(frames), -1, output.shape[-1]) for output in outputs]
+		return [[output[i] for output in outputs] for i in range(len(frames))]
+
+	@staticmethod
+	def _to_yolo_rows(boxes, confs):
+		# Convert (x1, y1, x2, y2) corners and class scores into (cx, cy, w, h, obj, scores...)
+		boxes = boxes.reshape(boxes.shape[0], -1, 4)
+		rows = np.empty(boxes.shape[:2] + (5 + confs.shape[-1],), dtype=np.float32)
+		rows[..., 0:2] = (boxes[..., 0:2] + boxes[..., 2:4]) / 2
+		rows[..., 2:4] = boxes[..., 2:4] - boxes[..., 0:2]
+		rows[..., 4] = 1
+		rows[..., 5:] = confs
+		return rows
+
+
+DETECTOR_BACKENDS = {
+	"opencv": OpenCVDetector,
+	"onnxruntime": ONNXRuntimeDetector,
+}
+
+def create_detector(config, roi=None):
+	"""Create, load and warm up the detector engine selected in `YOLO_CONFIG`,
+	optionally limited to the `roi` polygons.
+	"""
+	backend = config.get("BACKEND", "opencv")
+	if backend not in DETECTOR_BACKENDS:
+		raise ValueError(
+			"Invalid detector backend; must be one of {}".format(", ".join(DETECTOR_BACKENDS)))
+	detector = DETECTOR_BACKENDS[backend](config, roi)
+	detector.load()
+	detector.warm_up()
+	return detector
@@ -0,0 +1,314 @@
+import subprocess
+import threading
+import time
+import queue
+import numpy as np
+import cv2
+
+class FrameSource(object):
+	"""
+	Base class for the video frame readers.
+
+	It mirrors the parts of `cv2.VideoCapture` used by the pipeline (`read`,
+	`get`, `release`) and adds `skip`, which advances past a frame that is
+	not processed without converting it to an image. Subclasses count the
+	frames read or skipped so far in `position`.
+	"""
+
+	def read(self):
+		"""Decode the next frame. Returns `(ret, frame)` like `cv2.VideoCapture.read`."""
+		raise NotImplementedError
+
+	def skip(self):
+		"""Advance past the next frame without returning it. Returns False at the
+		end of the video, sources that do not touch skipped frames only find the
+		end on the next `read`.
+		"""
+		(ret, _) = self.read()
+		return ret
+
+	def sample(self, step):
+		"""Advance one frame. Every `step`-th frame is decoded, the others are
+		skipped and None is returned in place of the image.
+		"""
+		if (self.position + 1) % step != 0:
+			return self.skip(), None
+		return self.read()
+
+	def get(self, prop):
+		raise NotImplementedError
+
+	def stats(self):
+		return {}
+
+	def isOpened(self):
+		return True
+
+	def release(self):
+		pass
+
+
+class OpenCVFrameSource(FrameSource):
+	"""
+	Frames decoded by `cv2.VideoCapture`.
+
+	Skipped frames are only grabbed, so they are demuxed and decoded but
+	never converted and copied into a BGR image. With `seek` set, skipped
+	frames are not touched at all and `read` seeks straight to the next
+	frame it is asked for. Seeking pays off for large sampling steps on
+	files with frequent keyframes.
+	"""
+
+	def __init__(self, video_cap, seek=False):
+		self.cap = cv2.VideoCapture(video_cap)
+		self.seek = seek and not isinstance(video_cap, int)
+		self.position = 0
+		self.decoded_position = 0
+
+	def read(self):
+		if self.seek and self.position != self.decoded_position:
+			self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.position)
+		(ret, frame) = self.cap.read()
+		self.position += 1
+		self.decoded_position = self.position
+		return ret, frame
+
+	def skip(self):
+		if self.seek:
+			# Frame counts are estimates, the end shows when the next read fails
+			self.position += 1
+			return True
+		self.position += 1
+		self.decoded_position = self.position
+		return self.cap.grab()
+
+	def get(self, prop):
+		return self.cap.get(prop)
+
+	def isOpened(self):
+		return self.cap.isOpened()
+
+	def release(self):
+		self.cap.release()
+
+
+class FFmpegFrameSource(FrameSource):
+	"""
+	Frames decoded by an `ffmpeg` subprocess and read from its stdout pipe.
+
+	The frames are scaled to `width` inside the decoder, and with
+	`record_rate` set only the sampled frames are converted and sent through
+	the pipe, so `skip` costs nothing. Raw BGR bytes are read straight into the frame
+	arrays without intermediate buffers. Needs the `ffmpeg` executable on
+	the PATH.
+
+	Parameters
+	----------
+	video_path : str
+		Path of the video file.
+	width : int
+		Width of the decoded frames, 0 keeps the native size.
+	record_rate : Optional[float]
+		Frames processed per second of video. Only every
+		`int(fps / record_rate)`-th frame, the frames the processing loop
+		samples, is decoded into an image. The caller must call `skip` for
+		the others. None decodes every frame.
+
+	"""
+
+	def __init__(self, video_path, width=0, record_rate=None):
+		# Stream properties are read with OpenCV, the frames come from ffmpeg
+		cap = cv2.VideoCapture(video_path)
+		self.props = {prop: cap.get(prop) for prop in (cv2.CAP_PROP_FPS, cv2.CAP_PROP_FRAME_COUNT,
+			cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT)}
+		opened = cap.isOpened()
+		cap.release()
+		if not opened:
+			raise IOError("Cannot open video {}".format(video_path))
+
+		(native_width, native_height) = (int(self.props[cv2.CAP_PROP_FRAME_WIDTH]), int(self.props[cv2.CAP_PROP_FRAME_HEIGHT]))
+		filters = []
+		self.step = max(1, int(self.props[cv2.CAP_PROP_FPS] / record_rate)) if record_rate else 1
+		if self.step > 1:
+			# Keep the last frame of every step, as the processing loop does
+			filters.append("select=eq(mod(n\\,{0})\\,{1})".format(self.step, self.step - 1))
+		if width and width != native_width:
+			# Even height, as most codecs need it
+			height = int(round(native_height * width / native_width / 2.)) * 2
+			filters.append("scale={}:{}".format(width, height))
+			(native_width, native_height) = (width, height)
+		self.shape = (native_height, native_width, 3)
+		self.props[cv2.CAP_PROP_FRAME_WIDTH] = native_width
+		self.props[cv2.CAP_PROP_FRAME_HEIGHT] = native_height
+
+		command = ["ffmpeg", "-loglevel", "error", "-i", video_path]
+		if filters:
+			command += ["-vf", ",".join(filters)]
+		command += ["-vsync", "0", "-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+		# Unbuffered, so the pipe is read straight into the frames
+		self.process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=0)
+		self.position = 0
+
+	def read(self):
+		frame = np.empty(self.shape, dtype=np.uint8)
+		view = memoryview(frame).cast("B")
+		filled = 0
+		# Raw pipe reads return what ffmpeg has written so far, at most the pipe size
+		while filled < frame.nbytes:
+			count = self.process.stdout.readinto(view[filled:])
+			if not count:
+				return False, None
+			filled += count
+		self.position += 1
+		return True, frame
+
+	def skip(self):
+		# ffmpeg already dropped the frames between the sampled ones, the end
+		# shows when the next read fails
+		if self.step > 1:
+			self.position += 1
+			return True
+		(ret, _) = self.read()
+		return ret
+
+	def get(self, prop):
+		if prop == cv2.CAP_PROP_POS_FRAMES:
+			return self.position
+		return self.props.get(prop, 0)
+
+	def release(self):
+		# Killed rather than terminated, ffmpeg would try to flush into the closed pipe
+		self.process.kill()
+		self.process.wait()
+		self.process.stdout.close()
+
+
+class ThreadedFrameSource(FrameSource):
+	"""
+	Decodes frames of another frame source ahead in a reader thread.
+
+	The reader fills a bounded queue while the processing loop runs
+	inference, OpenCV and ffmpeg release the GIL while decoding so both run
+	in parallel. The reader starts on the first `sample` call and then
+	samples with that step. Skipped frames are handled by the reader too,
+	only the sampled frames and the end of the video are queued, each with
+	the number of frames the reader advanced. `sample` reports the skipped
+	frames up to that position. Queue depth and the time either side waited on the
+	other are kept for the job statistics.
+
+	Parameters
+	----------
+	source : FrameSource
+		The frame source that is read in the background.
+	queue_size : int
+		Number of frames decoded ahead.
+
+	"""
+
+	def __init__(self, source, queue_size=8):
+		self.source = source
+		self.queue = queue.Queue(max(1, queue_size))
+		self.running = threading.Event()
+		self.thread = None
+		self.error = None
+		self.position = 0
+		# Next queued `(ret, frame, position)`, held until the skipped frames before it are reported
+		self.next = None
+
+		self.depth_sum = 0
+		self.samples = 0
+		self.reader_stall = 0.
+		self.consumer_stall = 0.
+
+	def _put(self, item):
+		# Wait for a free slot until release stops the reader, which no longer drains the queue
+		while self.running.is_set():
+			try:
+				self.queue.put(item, timeout=0.1)
+				return
+			except queue.Full:
+				pass
+
+	def _read_ahead(self, step):
+		try:
+			ret = True
+			position = 0
+			while ret and self.running.is_set():
+				(ret, frame) = self.source.sample(step)
+				position += 1
+				if ret and frame is None:
+					# Skipped frame, nothing to hand over
+					continue
+				start = time.perf_counter()
+				# Time spent on a full queue, the processing loop is the bottleneck
+				self._put((ret, frame, position))
+				self.reader_stall += time.perf_counter() - start
+		except Exception as e:
+			self.error = e
+			self._put((False, None, 0))
+
+	def sample(self, step):
+		if self.thread is None:
+			self.running.set()
+			self.thread = threading.Thread(target=self._read_ahead, args=(step,), daemon=True)
+			self.thread.start()
+		if self.next is None:
+			self.depth_sum += self.queue.qsize()
+			self.samples += 1
+			start = time.perf_counter()
+			# Time spent on an empty queue, decoding is the bottleneck
+			self.next = self.queue.get()
+			self.consumer_stall += time.perf_counter() - start
+			if self.error is not None:
+				raise self.error
+		self.position += 1
+		(ret, frame, position) = self.next
+		if self.position < position:
+			# The reader skipped this frame on the way to the queued one
+			return True, None
+		self.next = None
+		return ret, frame
+
+	def read(self):
+		return self.sample(1)
+
+	def skip(self):
+		(ret, _) = self.sample(1)
+		return ret
+
+	def get(self, prop):
+		if prop == cv2.CAP_PROP_POS_FRAMES:
+			return self.position
+		return self.source.get(prop)
+
+	def stats(self):
+		return {
+			"DECODE_QUEUE_SIZE": self.queue.maxsize,
+			"DECODE_QUEUE_MEAN_DEPTH": round(self.depth_sum / max(1, self.samples), 2),
+			"DECODE_STALL_SECONDS": round(self.consumer_stall, 3),
+			"PROCESSING_STALL_SECONDS": round(self.reader_stall, 3)
+		}
+
+	def isOpened(self):
+		return self.source.isOpened()
+
+	def release(self):
+		self.running.clear()
+		if self.thread is not None:
+			self.thread.join()
+		self.source.release()
+
+
+def open_frame_source(video_cap, decoder="opencv", width=0, record_rate=None, seek=False, queue_size=0):
+	"""Open the frame source selected in `VIDEO_CONFIG`, read in a background
+	thread if `queue_size` is set. Cameras are always read with OpenCV.
+	"""
+	if decoder not in ("opencv", "ffmpeg"):
+		raise ValueError("Invalid decoder; must be one of opencv, ffmpeg")
+	if decoder == "ffmpeg" and not isinstance(video_cap, int):
+		source = FFmpegFrameSource(video_cap, width, record_rate)
+	else:
+		source = OpenCVFrameSource(video_cap, seek)
+	if queue_size > 0:
+		source = ThreadedFrameSource(source, queue_size)
+	return source
@@ -1,4 +1,4 @@
-from config import YOLO_CONFIG, VIDEO_CONFIG, SHOW_PROCESSING_OUTPUT, DATA_RECORD_RATE, FRAME_SIZE, TRACK_MAX_AGE
+from config import YOLO_CONFIG, REID_CONFIG, VIDEO_CONFIG, SHOW_PROCESSING_OUTPUT, DATA_RECORD_RATE, FRAME_SIZE, TRACK_MAX_AGE
 
 if FRAME_SIZE > 1920:
 	print("Frame size is too large!")
@@ -16,6 +16,8 @@ import os
 import csv
 import json
 from video_process import video_process
+from detector import create_detector
+from frame_source import open_frame_source
 from deep_sort import nn_matching
 from deep_sort.detection import Detection
 from deep_sort.tracker import Tracker
@@ -27,26 +29,15 @@ def main_analysis():
 	"""
 	# Read from video
 	IS_CAM = VIDEO_CONFIG["IS_CAM"]
-	cap = cv2.VideoCapture(VIDEO_CONFIG["VIDEO_CAP"])
+	cap = open_frame_source(VIDEO_CONFIG["VIDEO_CAP"], VIDEO_CONFIG["DECODER"], VIDEO_CONFIG["DECODE_WIDTH"],
+		DATA_RECORD_RATE, VIDEO_CONFIG["SEEK"], VIDEO_CONFIG["DECODE_QUEUE"])
 
-	# Load YOLOv3-tiny weights and config
-	WEIGHTS_PATH = YOLO_CONFIG["WEIGHTS_PATH"]
-	CONFIG_PATH = YOLO_CONFIG["CONFIG_PATH"]
-
-	# Load the YOLOv3-tiny pre-trained COCO dataset 
-	net = cv2.dnn.readNetFromDarknet(CONFIG_PATH, WEIGHTS_PATH)
-	# Set the preferable backend to CPU since we are not using GPU
-	net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
-	net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
-
-	# Get the names of all the layers in the network
-	ln = net.getLayerNames()
-	# Filter out the layer names we dont need for YOLO
-	ln = [ln[i - 1] for i in net.getUnconnectedOutLayers()]
+	# Load the YOLO detector engine selected in the config
+	detector = create_detector(YOLO_CONFIG, VIDEO_CONFIG["ROI"])
 
 	# Tracker parameters
 	max_cosine_distance = 0.7
-	nn_budget = None
+	nn_budget = REID_CONFIG["GALLERY_BUDGET"]
 
 	#initialize deep sort object
 	if IS_CAM: 
@@ -55,8 +46,9 @@ def main_analysis():
 		max_age=DATA_RECORD_RATE * TRACK_MAX_AGE
 		if max_age > 30:
 			max_age = 30
-	model_filename = 'model_data/mars-small128.pb'
-	encoder = gdet.create_box_encoder(model_filename, batch_size=1)
+	model_filename = REID_CONFIG["MODEL_PATH"]
+	encoder = gdet.create_box_encoder(model_filename, batch_size=REID_CONFIG["MAX_BATCH_SIZE"],
+		backend=REID_CONFIG["BACKEND"])
 	metric = nn_matching.NearestNeighborDistanceMetric("cosine", max_cosine_distance, nn_budget)
 	tracker = Tracker(metric, max_age=max_age)
 
@@ -76,7 +68,8 @@ def main_analysis():
 
 	START_TIME = time.time()
 
-	processing_FPS = video_process(cap, FRAME_SIZE, net, ln, encoder, tracker, movement_data_writer, crowd_data_writer)
+	stats = {}
+	processing_FPS = video_process(cap, FRAME_SIZE, detector, encoder, tracker, movement_data_writer, crowd_data_writer, stats)
 	cv2.destroyAllWindows()
 	movement_data_file.close()
 	crowd_data_file.close()
@@ -84,6 +77,7 @@ def main_analysis():
 	END_TIME = time.time()
 	PROCESS_TIME = END_TIME - START_TIME
 	print("Time elapsed: ", PROCESS_TIME)
+	print("Frame statistics: ", stats)
 	if IS_CAM:
 		print("Processed FPS: ", processing_FPS)
 		VID_FPS = processing_FPS
@@ -105,7 +99,8 @@ def main_analysis():
 		"PROCESSED_FRAME_SIZE": FRAME_SIZE,
 		"TRACK_MAX_AGE": TRACK_MAX_AGE,
 		"START_TIME": START_TIME.strftime("%d/%m/%Y, %H:%M:%S"),
-		"END_TIME": END_TIME.strftime("%d/%m/%Y, %H:%M:%S")
+		"END_TIME": END_TIME.strftime("%d/%m/%Y, %H:%M:%S"),
+		"PIPELINE_STATS": stats
 	}
 
 	with open('processed_data/video_data.json', 'w') as video_data_file:
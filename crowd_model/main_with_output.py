@@ -1,4 +1,4 @@
-from config import YOLO_CONFIG, VIDEO_CONFIG, SHOW_PROCESSING_OUTPUT, DATA_RECORD_RATE, FRAME_SIZE, TRACK_MAX_AGE
+from config import YOLO_CONFIG, REID_CONFIG, VIDEO_CONFIG, SHOW_PROCESSING_OUTPUT, DATA_RECORD_RATE, FRAME_SIZE, TRACK_MAX_AGE
 
 if FRAME_SIZE > 1920:
 	print("Frame size is too large!")
@@ -16,34 +16,36 @@ import os
 import csv
 import json
 from video_process_with_output import video_process_with_output
+from detector import create_detector
+from frame_source import open_frame_source
 from deep_sort import nn_matching
 from deep_sort.detection import Detection
 from deep_sort.tracker import Tracker
 from deep_sort import generate_detections as gdet
 
-def main_analysis_with_output(output_dir="processed_data", save_video=True):
+def main_analysis_with_output(output_dir="processed_data", save_video=True, stats=None):
 	"""
 	Main analysis function that saves processed video with overlays
 	"""
 	# Read from video
 	IS_CAM = VIDEO_CONFIG["IS_CAM"]
-	cap = cv2.VideoCapture(VIDEO_CONFIG["VIDEO_CAP"])
+	cap = open_frame_source(VIDEO_CONFIG["VIDEO_CAP"], VIDEO_CONFIG["DECODER"], VIDEO_CONFIG["DECODE_WIDTH"],
+		None, VIDEO_CONFIG["SEEK"], VIDEO_CONFIG["DECODE_QUEUE"])
 
 	# Set up tracking
 	max_cosine_distance = 0.5
-	nn_budget = None
+	nn_budget = REID_CONFIG["GALLERY_BUDGET"]
 	nms_max_overlap = 0.8
 
-	model_filename = 'model_data/mars-small128.pb'
-	encoder = gdet.create_box_encoder(model_filename, batch_size=1)
+	model_filename = REID_CONFIG["MODEL_PATH"]
+	encoder = gdet.create_box_encoder(model_filename, batch_size=REID_CONFIG["MAX_BATCH_SIZE"],
+		backend=REID_CONFIG["BACKEND"])
 	metric = nn_matching.NearestNeighborDistanceMetric("cosine", max_cosine_distance, nn_budget)
 	tracker = Tracker(metric, max_age=TRACK_MAX_AGE)
 
 	# Load YOLO
 	print("Loading YOLO...")
-	net = cv2.dnn.readNet(YOLO_CONFIG["WEIGHTS_PATH"], YOLO_CONFIG["CONFIG_PATH"])
-	ln = net.getLayerNames()
-	ln = [ln[i - 1] for i in net.getUnconnectedOutLayers()]
+	detector = create_detector(YOLO_CONFIG, VIDEO_CONFIG["ROI"])
 	print("YOLO loaded successfully")
 
 	# Create output directory
@@ -70,10 +72,12 @@ def main_analysis_with_output(output_dir="processed_data", save_video=True):
 
 	# Process video with output
 	print("Processing video...")
+	if stats is None:
+		stats = {}
 	processing_FPS = video_process_with_output(
-		cap, FRAME_SIZE, net, ln, encoder, tracker, 
+		cap, FRAME_SIZE, detector, encoder, tracker, 
 		movement_data_writer, crowd_data_writer, 
-		output_video_path, START_TIME
+		output_video_path, START_TIME, stats
 	)
 
 	# Cleanup
@@ -85,6 +89,7 @@ def main_analysis_with_output(output_dir="processed_data", save_video=True):
 	START_TIME_EPOCH = time.mktime(START_TIME.timetuple())
 	PROCESS_TIME = END_TIME - START_TIME_EPOCH
 	print("Time elapsed: ", PROCESS_TIME)
+	print("Frame statistics: ", stats)
 
 	if IS_CAM:
 		print("Processed FPS: ", processing_FPS)
@@ -109,7 +114,8 @@ def main_analysis_with_output(output_dir="processed_data", save_video=True):
 		"START_TIME": START_TIME.strftime("%d/%m/%Y, %H:%M:%S"),
 		"END_TIME": END_TIME.strftime("%d/%m/%Y, %H:%M:%S") if isinstance(END_TIME, datetime.datetime) else str(END_TIME),
 		"PROCESSED_VIDEO_PATH": output_video_path if save_video else None,
-		"OUTPUT_DIRECTORY": output_dir
+		"OUTPUT_DIRECTORY": output_dir,
+		"PIPELINE_STATS": stats
 	}
 
 	with open(f'{output_dir}/video_data.json', 'w') as video_data_file:
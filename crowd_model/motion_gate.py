@@ -0,0 +1,68 @@
+import numpy as np
+import cv2
+
+class MotionGate(object):
+	"""
+	Cheap scene change test used to skip the detector on static frames.
+
+	Every frame is shrunk to a small blurred grayscale copy and differenced
+	against the last frame the gate let through, whether the tracker then
+	detected on it or coasted it between keyframes. The scene is static
+	while fewer than `min_changed_ratio` of the pixels differ by more than
+	`pixel_threshold`. Comparing against that reference, rather than the
+	previous frame, lets slow changes add up until they open the gate. After
+	`max_skip` static frames in a row one frame is let through anyway, so
+	tracks keep ageing.
+	"""
+
+	def __init__(self, enabled=False, width=160, pixel_threshold=25, min_changed_ratio=0.002, max_skip=50):
+		self.enabled = enabled
+		self.width = width
+		self.pixel_threshold = pixel_threshold
+		self.min_changed_ratio = min_changed_ratio
+		self.max_skip = max_skip
+		self.reference = None
+		self.skipped = 0
+		self.in_static_period = False
+
+		self.skipped_frames = 0
+		self.passed_frames = 0
+		self.static_periods = 0
+
+	def is_static(self, frame, frame_count=None):
+		if not self.enabled:
+			return False
+		(frame_height, frame_width) = frame.shape[:2]
+		height = max(1, int(frame_height * self.width / frame_width))
+		small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+		gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+		forced = self.skipped >= self.max_skip
+		static = False
+		if self.reference is not None and not forced:
+			changed = np.count_nonzero(cv2.absdiff(gray, self.reference) > self.pixel_threshold)
+			static = changed < self.min_changed_ratio * gray.size
+
+		if static:
+			if not self.in_static_period:
+				self.in_static_period = True
+				self.static_periods += 1
+				print("\nMotion gate: scene static from frame {}, skipping detection".format(frame_count))
+			self.skipped += 1
+			self.skipped_frames += 1
+			return True
+
+		if self.in_static_period and not forced:
+			self.in_static_period = False
+			print("\nMotion gate: scene changed at frame {}, resuming detection".format(frame_count))
+		self.reference = gray
+		self.skipped = 0
+		self.passed_frames += 1
+		return False
+
+	def stats(self):
+		return {
+			"MOTION_GATE_SKIPPED_FRAMES": self.skipped_frames,
+			"MOTION_GATE_PASSED_FRAMES": self.passed_frames,
+			"MOTION_GATE_STATIC_PERIODS": self.static_periods
+		}
@@ -0,0 +1,63 @@
+import tempfile
+from collections import defaultdict
+import numpy as np
+
+class MovementStore(object):
+	"""
+	Movement trails of the live tracks, spooled to a temporary file in chunks.
+
+	Tracks keep only the latest `tail` centroids in memory, which is all the
+	per-frame analytics look at. Whenever a track holds `chunk_size`
+	centroids more than that, `flush` appends the older ones to the spool
+	file. `trajectory` reassembles the full trail from the chunks and the
+	tail when the track is recorded.
+
+	Parameters
+	----------
+	chunk_size : int
+		Number of centroids a track spools at once.
+	tail : int
+		Number of latest centroids kept in memory, at least 2.
+
+	"""
+
+	def __init__(self, chunk_size=256, tail=16):
+		self.chunk_size = max(1, chunk_size)
+		self.tail = max(2, tail)
+		self.spool = tempfile.TemporaryFile()
+		# Track id to the (offset, count) of its chunks in the spool file
+		self.chunks = defaultdict(list)
+		self.spooled_positions = 0
+
+	def flush(self, tracks):
+		"""Spool the old centroids of the tracks that collected a full chunk."""
+		for track in tracks:
+			if len(track.positions) >= self.tail + self.chunk_size:
+				positions = track.pop_positions(len(track.positions) - self.tail)
+				self.spool.seek(0, 2)
+				self.chunks[track.track_id].append((self.spool.tell(), len(positions)))
+				self.spool.write(positions.astype(np.int32).tobytes())
+				self.spooled_positions += len(positions)
+
+	def trajectory(self, track):
+		"""The full movement trail of `track`, the spooled chunks followed by the
+		centroids in memory. The chunks are forgotten afterwards.
+		"""
+		parts = []
+		for (offset, count) in self.chunks.pop(track.track_id, []):
+			self.spool.seek(offset)
+			parts.append(np.frombuffer(self.spool.read(count * 8), dtype=np.int32).reshape(count, 2))
+		parts.append(track.positions)
+		return np.concatenate(parts)
+
+	def discard(self, track):
+		"""Forget the spooled chunks of a track that is not recorded."""
+		self.chunks.pop(track.track_id, None)
+
+	def stats(self):
+		return {
+			"MOVEMENT_SPOOLED_POSITIONS": self.spooled_positions
+		}
+
+	def close(self):
+		self.spool.close()
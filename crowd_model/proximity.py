@@ -0,0 +1,98 @@
+import itertools
+from collections import defaultdict
+import numpy as np
+from util import rect_gaps
+
+class ProximityGrid(object):
+	"""
+	Uniform grid hash of the tracked people, for finding the pairs closer
+	than a distance without comparing all pairs.
+
+	Every person is entered into the grid cells covered by their box or
+	centroid, grown by half the distance on each side. With cells as large
+	as the distance, two people closer than it always share a cell, so only
+	people sharing a cell are compared exactly. The grid is kept between
+	frames and a person is only moved when the cells they cover change.
+
+	Parameters
+	----------
+	distance : float
+		Pairs closer than this distance, in pixels, are reported.
+	high_cam : bool
+		Compare `(x, y)` centroids by euclidean distance, otherwise
+		`(x1, y1, x2, y2)` boxes by the gap between them.
+	min_people : int
+		Number of people from which the grid is worth using instead of the
+		all pairs distance matrix.
+
+	"""
+
+	def __init__(self, distance, high_cam=False, min_people=0):
+		self.distance = distance
+		self.high_cam = high_cam
+		self.min_people = min_people
+		self.cell_size = max(1., float(distance))
+		# Grid cell to the track ids in it, and track id to its covered cell range
+		self.cells = defaultdict(set)
+		self.ranges = {}
+
+	def _insert(self, track_id, cell_range):
+		(x1, y1, x2, y2) = cell_range
+		for cell in itertools.product(range(x1, x2 + 1), range(y1, y2 + 1)):
+			self.cells[cell].add(track_id)
+		self.ranges[track_id] = cell_range
+
+	def _remove(self, track_id):
+		(x1, y1, x2, y2) = self.ranges.pop(track_id)
+		for cell in itertools.product(range(x1, x2 + 1), range(y1, y2 + 1)):
+			members = self.cells[cell]
+			members.discard(track_id)
+			if not members:
+				del self.cells[cell]
+
+	def update(self, track_ids, shapes):
+		"""Move the people of the current frame to their cells, people no longer tracked are removed."""
+		rects = self._rects(shapes)
+		margin = self.distance / 2.
+		cell_ranges = np.floor((rects + (-margin, -margin, margin, margin)) / self.cell_size).astype(int)
+		present = set(track_ids)
+		for track_id in [t for t in self.ranges if t not in present]:
+			self._remove(track_id)
+		for track_id, cell_range in zip(track_ids, map(tuple, cell_ranges.tolist())):
+			previous = self.ranges.get(track_id)
+			if previous == cell_range:
+				continue
+			if previous is not None:
+				self._remove(track_id)
+			self._insert(track_id, cell_range)
+
+	def close_pairs(self, track_ids, shapes):
+		"""Index pairs `(first, second)` into `track_ids` of the people closer than the distance.
+
+		`shapes` are the centroids or the boxes of the people, as set by `high_cam`.
+		"""
+		self.update(track_ids, shapes)
+		index = {track_id: i for i, track_id in enumerate(track_ids)}
+		candidates = set()
+		for members in self.cells.values():
+			if len(members) > 1:
+				candidates.update(itertools.combinations(sorted(index[m] for m in members), 2))
+		if not candidates:
+			return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+		# People sharing a cell may still be too far apart, check them exactly
+		(first, second) = np.array(list(candidates)).T
+		if self.high_cam:
+			points = np.asarray(shapes, dtype=float).reshape(-1, 2)
+			distances = np.hypot(*(points[first] - points[second]).T)
+		else:
+			rects = np.asarray(shapes, dtype=float).reshape(-1, 4)
+			distances = rect_gaps(rects[first], rects[second])
+		close = distances < self.distance
+		return first[close], second[close]
+
+	def _rects(self, shapes):
+		if self.high_cam:
+			points = np.asarray(shapes, dtype=float).reshape(-1, 2)
+			return np.hstack((points, points))
+		return np.asarray(shapes, dtype=float).reshape(-1, 4)
@@ -0,0 +1,186 @@
+"""
+Produce INT8 (or FP16-weight) variants of the YOLO detector and the re-ID
+encoder, calibrated on frames from a user supplied video, and report how far
+they drift from the float models.
+
+Both models are quantized in their ONNX form. The detector is the model at
+YOLO_CONFIG["ONNX_PATH"]; the re-ID encoder is an ONNX export of
+mars-small128.pb, see README.md on how to create it.
+
+The variants are written next to the float models as `<name>.int8.onnx` or
+`<name>.fp16.onnx`. Load them by pointing YOLO_CONFIG["ONNX_PATH"] (with the
+`onnxruntime` backend) and REID_CONFIG["MODEL_PATH"] at the new files.
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+import imutils
+import cv2
+from config import YOLO_CONFIG, FRAME_SIZE
+from detector import ONNXRuntimeDetector
+from deep_sort.generate_detections import ONNXImageEncoder, extract_image_patches
+
+def sample_frames(video_path, count, offset=0.0):
+	# Evenly spaced frames over the whole video, shifted by a fraction of the step
+	cap = cv2.VideoCapture(video_path)
+	total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+	frames = []
+	for index in ((np.arange(count) + offset) * total / count).astype(int):
+		cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+		(ret, frame) = cap.read()
+		if ret:
+			frames.append(imutils.resize(frame, width=FRAME_SIZE))
+	cap.release()
+	return frames
+
+def extract_patches(encoder, frame, boxes):
+	(patches, valid) = extract_image_patches(frame, boxes, encoder.image_shape[:2])
+	return patches[valid]
+
+def variant_path(model_path, mode, output_dir):
+	name = os.path.splitext(os.path.basename(model_path))[0]
+	return os.path.join(output_dir or os.path.dirname(model_path), "{}.{}.onnx".format(name, mode))
+
+def quantize(model_path, output_path, mode, calibration_inputs):
+	if mode == "fp16":
+		import onnx
+		from onnxconverter_common import float16
+		model = float16.convert_float_to_float16(onnx.load(model_path), keep_io_types=True)
+		onnx.save(model, output_path)
+		return
+
+	from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+	class _Reader(CalibrationDataReader):
+		def __init__(self):
+			self.inputs = iter(calibration_inputs)
+
+		def get_next(self):
+			return next(self.inputs, None)
+
+	quantize_static(model_path, output_path, _Reader(),
+		quant_format=QuantFormat.QDQ, per_channel=True,
+		activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+def time_calls(f, inputs):
+	start = time.perf_counter()
+	outputs = [f(x) for x in inputs]
+	return outputs, (time.perf_counter() - start) / max(1, len(inputs))
+
+def compare_detectors(float_detector, quant_detector, frames):
+	float_results, float_latency = time_calls(lambda frame: float_detector.infer([frame])[0], frames)
+	quant_results, quant_latency = time_calls(lambda frame: quant_detector.infer([frame])[0], frames)
+	float_counts = np.array([len(boxes) for boxes, _, _ in float_results])
+	quant_counts = np.array([len(boxes) for boxes, _, _ in quant_results])
+	return {
+		"frames": len(frames),
+		"float_mean_count": float(float_counts.mean()),
+		"quantized_mean_count": float(quant_counts.mean()),
+		"mean_abs_count_drift": float(np.abs(float_counts - quant_counts).mean()),
+		"total_count_drift_ratio": float((quant_counts.sum() - float_counts.sum()) / max(1, float_counts.sum())),
+		"float_ms_per_frame": float_latency * 1000,
+		"quantized_ms_per_frame": quant_latency * 1000,
+	}
+
+def _normalize(features):
+	return features / np.maximum(np.linalg.norm(features, axis=1, keepdims=True), 1e-12)
+
+def compare_encoders(float_encoder, quant_encoder, frame_patches):
+	frame_patches = [patches for patches in frame_patches if len(patches) > 0]
+	float_features, float_latency = time_calls(float_encoder, frame_patches)
+	quant_features, quant_latency = time_calls(quant_encoder, frame_patches)
+	self_distance = []
+	pairwise_drift = []
+	for a, b in zip(float_features, quant_features):
+		a, b = _normalize(a), _normalize(b)
+		# Cosine distance between the float and quantized embedding of the same person
+		self_distance.append(1. - np.sum(a * b, axis=1))
+		# Change of the person-to-person distances the tracker matches on
+		pairwise_drift.append(np.abs(np.dot(a, a.T) - np.dot(b, b.T)).ravel())
+	self_distance = np.concatenate(self_distance) if self_distance else np.zeros(0)
+	pairwise_drift = np.concatenate(pairwise_drift) if pairwise_drift else np.zeros(0)
+	return {
+		"frames": len(frame_patches),
+		"patches": int(len(self_distance)),
+		"mean_feature_distance": float(self_distance.mean()) if len(self_distance) else 0.,
+		"max_feature_distance": float(self_distance.max()) if len(self_distance) else 0.,
+		"mean_pairwise_distance_drift": float(pairwise_drift.mean()) if len(pairwise_drift) else 0.,
+		"float_ms_per_frame": float_latency * 1000,
+		"quantized_ms_per_frame": quant_latency * 1000,
+	}
+
+def print_report(title, report):
+	print("\n" + title)
+	for key, value in report.items():
+		print("  {:<32} {}".format(key, round(value, 4) if isinstance(value, float) else value))
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Quantize the detector and re-ID models")
+	parser.add_argument("--video", required=True, help="Video to sample calibration and evaluation frames from")
+	parser.add_argument("--mode", choices=["int8", "fp16"], default="int8", help="Quantization mode")
+	parser.add_argument("--frames", type=int, default=100, help="Number of calibration frames")
+	parser.add_argument("--eval-frames", type=int, default=50, help="Number of evaluation frames")
+	parser.add_argument("--yolo", default=YOLO_CONFIG["ONNX_PATH"], help="Float YOLO ONNX model")
+	parser.add_argument("--reid", default="model_data/mars-small128.onnx", help="Float re-ID ONNX model")
+	parser.add_argument("--output-dir", default=None, help="Output directory. Defaults to the directory of each model")
+	parser.add_argument("--report", default="quantization_report.json", help="Path of the JSON report")
+	return parser.parse_args()
+
+def main():
+	args = parse_args()
+	calibration_frames = sample_frames(args.video, args.frames)
+	eval_frames = sample_frames(args.video, args.eval_frames, offset=0.5)
+	if not calibration_frames or not eval_frames:
+		print("No frames could be read from {}".format(args.video))
+		return
+
+	float_detector = ONNXRuntimeDetector(dict(YOLO_CONFIG, ONNX_PATH=args.yolo))
+	float_detector.load()
+	float_encoder = ONNXImageEncoder(args.reid)
+
+	# Calibrate the detector on its own input blobs and the encoder on person
+	# patches found by the float detector
+	print("Quantizing {} ...".format(args.yolo))
+	yolo_path = variant_path(args.yolo, args.mode, args.output_dir)
+	quantize(args.yolo, yolo_path, args.mode,
+		[{float_detector.input_name: float_detector.preprocess([frame]).copy()} for frame in calibration_frames])
+
+	print("Quantizing {} ...".format(args.reid))
+	reid_path = variant_path(args.reid, args.mode, args.output_dir)
+	calibration_patches = []
+	for frame in calibration_frames:
+		[(boxes, _, _)] = float_detector.infer([frame])
+		patches = extract_patches(float_encoder, frame, boxes)
+		if len(patches) > 0:
+			calibration_patches.append({float_encoder.input_name: patches.astype(float_encoder.input_dtype)})
+	if not calibration_patches:
+		print("No persons were detected in the calibration frames, cannot calibrate the re-ID encoder")
+		return
+	quantize(args.reid, reid_path, args.mode, calibration_patches)
+
+	quant_detector = ONNXRuntimeDetector(dict(YOLO_CONFIG, ONNX_PATH=yolo_path))
+	quant_detector.load()
+	quant_encoder = ONNXImageEncoder(reid_path)
+	float_detector.warm_up()
+	quant_detector.warm_up()
+
+	eval_patches = []
+	for frame in eval_frames:
+		[(boxes, _, _)] = float_detector.infer([frame])
+		eval_patches.append(extract_patches(float_encoder, frame, boxes))
+	report = {
+		"mode": args.mode,
+		"detector": dict(compare_detectors(float_detector, quant_detector, eval_frames), model=yolo_path),
+		"reid": dict(compare_encoders(float_encoder, quant_encoder, eval_patches), model=reid_path),
+	}
+	print_report("Detector ({})".format(yolo_path), report["detector"])
+	print_report("Re-ID encoder ({})".format(reid_path), report["reid"])
+
+	with open(args.report, "w") as report_file:
+		json.dump(report, report_file, indent=4)
+	print("\nReport saved to: {}".format(args.report))
+
+if __name__ == "__main__":
+	main()
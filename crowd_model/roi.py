@@ -0,0 +1,73 @@
+import numpy as np
+import cv2
+
+def merge_rects(rects):
+	"""Merge overlapping `(x, y, w, h)` rectangles into their bounding
+	rectangles until no two of them overlap.
+	"""
+	rects = [tuple(rect) for rect in rects]
+	merged = True
+	while merged:
+		merged = False
+		for i in range(len(rects)):
+			for j in range(i + 1, len(rects)):
+				(x1, y1, w1, h1), (x2, y2, w2, h2) = rects[i], rects[j]
+				if x1 < x2 + w2 and x2 < x1 + w1 and y1 < y2 + h2 and y2 < y1 + h1:
+					x, y = min(x1, x2), min(y1, y2)
+					rects[i] = (x, y, max(x1 + w1, x2 + w2) - x, max(y1 + h1, y2 + h2) - y)
+					del rects[j]
+					merged = True
+					break
+			if merged:
+				break
+	return rects
+
+
+class RegionOfInterest(object):
+	"""
+	Polygonal zones of a camera view that detection is limited to.
+
+	The polygons are given in coordinates relative to the frame size, so they
+	stay valid at any processing resolution. The crop rectangles and the
+	inside mask are computed once per frame size.
+
+	Parameters
+	----------
+	polygons : List[List[(float, float)]]
+		Polygon vertices as `(x, y)` fractions of the frame width and height.
+
+	"""
+
+	def __init__(self, polygons):
+		self.polygons = [np.asarray(polygon, dtype=float) for polygon in polygons]
+		self.frame_size = None
+
+	def _scale(self, frame_width, frame_height):
+		if self.frame_size == (frame_width, frame_height):
+			return
+		self.frame_size = (frame_width, frame_height)
+		scaled = [np.round(polygon * (frame_width, frame_height)).astype(np.int32) for polygon in self.polygons]
+		self.mask = np.zeros((frame_height, frame_width), dtype=np.uint8)
+		cv2.fillPoly(self.mask, scaled, 1)
+		# Crop each polygon to its bounding rectangle, overlapping rectangles are detected as one crop
+		rects = []
+		for polygon in scaled:
+			(x, y, w, h) = cv2.boundingRect(polygon)
+			x, y = max(0, x), max(0, y)
+			w, h = min(frame_width, x + w) - x, min(frame_height, y + h) - y
+			if w > 0 and h > 0:
+				rects.append((x, y, w, h))
+		self.rects = merge_rects(rects)
+
+	def crops(self, frame_width, frame_height):
+		"""Rectangles `(x, y, w, h)` that cover all polygons of the frame."""
+		self._scale(frame_width, frame_height)
+		return self.rects
+
+	def contains(self, points, frame_width, frame_height):
+		"""Boolean mask of the `(x, y)` points that lie inside a polygon."""
+		self._scale(frame_width, frame_height)
+		points = np.asarray(points, dtype=int).reshape(-1, 2)
+		x = np.clip(points[:, 0], 0, frame_width - 1)
+		y = np.clip(points[:, 1], 0, frame_height - 1)
+		return self.mask[y, x].astype(bool)
@@ -0,0 +1,57 @@
+import numpy as np
+from deep_sort.detection import Detection
+from deep_sort.track import Track
+from movement_store import MovementStore
+
+def make_track(track_id, position):
+	return Track(np.zeros(8), np.eye(8), track_id, 0, position, 3, 30)
+
+def observe(track, position):
+	track.mark_updated(Detection(np.array([0., 0., 10., 20.]), 0.9, np.asarray(position), np.zeros(4)))
+
+def test_trajectory_round_trip_with_small_chunks():
+	store = MovementStore(chunk_size=5, tail=2)
+	rng = np.random.default_rng(0)
+	trails = {1: [(0, 0)], 2: [(100, 100)]}
+	tracks = [make_track(track_id, trail[0]) for track_id, trail in trails.items()]
+	for _ in range(37):
+		for track in tracks:
+			position = tuple(rng.integers(0, 1920, 2))
+			trails[track.track_id].append(position)
+			observe(track, position)
+		store.flush(tracks)
+		# Only the tail and a partly filled chunk stay in memory
+		for track in tracks:
+			assert len(track.positions) < store.tail + store.chunk_size
+	assert store.stats()["MOVEMENT_SPOOLED_POSITIONS"] > 0
+
+	for track in tracks:
+		trajectory = store.trajectory(track)
+		assert trajectory.dtype == np.int32
+		np.testing.assert_array_equal(trajectory, np.array(trails[track.track_id]))
+		# The chunks are forgotten once the trail was read back
+		assert track.track_id not in store.chunks
+	store.close()
+
+def test_flush_keeps_short_trails_in_memory():
+	store = MovementStore(chunk_size=5, tail=2)
+	track = make_track(1, (0, 0))
+	for i in range(5):
+		observe(track, (i, i))
+	store.flush([track])
+	assert len(track.positions) == 6
+	assert store.stats()["MOVEMENT_SPOOLED_POSITIONS"] == 0
+	np.testing.assert_array_equal(store.trajectory(track), track.positions)
+	store.close()
+
+def test_discard_forgets_spooled_chunks():
+	store = MovementStore(chunk_size=2, tail=2)
+	track = make_track(1, (0, 0))
+	for i in range(6):
+		observe(track, (i, i))
+	store.flush([track])
+	assert track.track_id in store.chunks
+	store.discard(track)
+	assert track.track_id not in store.chunks
+	np.testing.assert_array_equal(store.trajectory(track), track.positions)
+	store.close()
@@ -1,80 +1,118 @@
 import numpy as np
-import cv2
-from config import MIN_CONF, NMS_THRESH 
-
-from deep_sort import nn_matching
-from deep_sort.detection import Detection
-from deep_sort.tracker import Tracker
-from deep_sort import generate_detections as gdet
-
-def detect_human (net, ln, frame, encoder, tracker, time):
-# Get the dimension of the frame
-	(frame_height, frame_width) = frame.shape[:2]
-	# Initialize lists needed for detection
-	boxes = []
-	centroids = []
-	confidences = []
-
-	# Construct a blob from the input frame 
-	blob = cv2.dnn.blobFromImage(frame, 1 / 255.0, (416, 416),
-		swapRB=True, crop=False)
-
-	# Perform forward pass of YOLOv3, output are the boxes and probabilities
-	net.setInput(blob)
-	layer_outputs = net.forward(ln)
-
-	# For each output
-	for output in layer_outputs:
-		# For each detection in output 
-		for detection in output:
-			# Extract the class ID and confidence 
-			scores = detection[5:]
-			class_id = np.argmax(scores)
-			confidence = scores[class_id]
-			# Class ID for person is 0, check if the confidence meet threshold
-			if class_id == 0 and confidence > MIN_CONF:
-				# Scale the bounding box coordinates back to the size of the image
-				box = detection[0:4] * np.array([frame_width, frame_height, frame_width, frame_height])
-				(center_x, center_y, width, height) = box.astype("int")
-				# Derive the coordinates for the top left corner of the bounding box
-				x = int(center_x - (width / 2))
-				y = int(center_y - (height / 2))
-				# Add processed results to respective list
-				boxes.append([x, y, int(width), int(height)])
-				centroids.append((center_x, center_y))
-				confidences.append(float(confidence))
-	# Perform Non-maxima suppression to suppress weak and overlapping boxes
-	# It will filter out unnecessary boxes, i.e. box within box
-	# Output will be indexs of useful boxes
-	idxs = cv2.dnn.NMSBoxes(boxes, confidences, MIN_CONF, NMS_THRESH)
 
+from deep_sort.detection import DetectionBatch
+
+# How a processed frame is tracked: run the detector, advance the tracks with
+# the Kalman filter only, or reuse the previous result for a static scene
+DETECT = "detect"
+COAST = "coast"
+REUSE = "reuse"
+
+def _tracked_humans(tracker):
+	# Obtain info from the tracks
+	return [track for track in tracker.tracks if track.is_confirmed() and track.time_since_update <= 5]
+
+def propagate_human(tracker):
+	# Advance the tracks with the Kalman filter only, no detection is run
+	tracker.coast()
+	return [_tracked_humans(tracker), []]
+
+def track_human(frame, boxes, centroids, confidences, encoder, tracker, time, scale=1., features=None):
 	tracked_bboxes = []
 	expired = []
-	if len(idxs) > 0:
-		del_idxs = []
-		for i in range(len(boxes)):
-			if i not in idxs:
-				del_idxs.append(i)
-		for i in sorted(del_idxs, reverse=True):
-			del boxes[i]
-			del centroids[i]
-			del confidences[i]
-
-		boxes = np.array(boxes)
-		centroids = np.array(centroids)
-		confidences = np.array(confidences)
-		features = np.array(encoder(frame, boxes))
-		detections = [Detection(bbox, score, centroid, feature) for bbox, score, centroid, feature in zip(boxes, scores, centroids, features)]
+	if len(boxes) > 0:
+		if features is None:
+			features = np.array(encoder(frame, boxes))
+		# Map the boxes from the detected frame into the analytics frame
+		if scale != 1.:
+			boxes = boxes * scale
+			centroids = (centroids * scale).astype(int)
+		# The detections are views into the arrays of the frame
+		detections = DetectionBatch(boxes, confidences, centroids, features).detections()
 
 		tracker.predict()
 		expired = tracker.update(detections, time)
 
-
-		# Obtain info from the tracks
-		for track in tracker.tracks:
-				if not track.is_confirmed() or track.time_since_update > 5:
-						continue 
-				tracked_bboxes.append(track)
+		tracked_bboxes = _tracked_humans(tracker)
 
 	return [tracked_bboxes, expired]
 
+def track_frames(detector, encoder, tracker, frames, times, modes, scale=1.):
+	# Detect humans in all detection frames with one forward pass, `scale` maps
+	# the frame coordinates to the analytics frame the tracker works in
+	detect_frames = [frame for frame, mode in zip(frames, modes) if mode == DETECT]
+	detections = detector.infer(detect_frames) if detect_frames else []
+	# Encode the persons of all detection frames together, features do not depend on the tracker state
+	features = [None] * len(detections)
+	if len(detections) > 1:
+		features = encoder.encode_frames(detect_frames, [boxes for boxes, _, _ in detections])
+	detections = iter(zip(detections, features))
+	# Hand the results to the tracker strictly in frame order
+	for frame, time, mode in zip(frames, times, modes):
+		if mode == DETECT:
+			((boxes, centroids, confidences), frame_features) = next(detections)
+			yield track_human(frame, boxes, centroids, confidences, encoder, tracker, time, scale, frame_features)
+		elif mode == COAST:
+			yield propagate_human(tracker)
+		else:
+			# Static scene, the tracker is left untouched and the previous result is reused
+			yield [_tracked_humans(tracker), []]
+
+class KeyframeScheduler(object):
+	"""
+	Decides which processed frames are run through the detector.
+
+	The detector runs on every `interval`-th frame, and earlier when the
+	predicted position of a tracked person becomes too uncertain. With
+	`adaptive` set, the interval follows the crowd motion: it is the number
+	of frames the fastest track needs to move `max_motion` box heights,
+	limited to `max_interval`.
+
+	Each decision looks at the tracker state after the previous frame, so
+	frames can not be detected in batches while the scheduler is in use.
+	"""
+
+	def __init__(self, interval=1, adaptive=False, max_interval=5, max_motion=0.25, max_uncertainty=0.5):
+		self.base_interval = max(1, interval)
+		self.interval = self.base_interval
+		self.adaptive = adaptive
+		self.max_interval = max(self.base_interval, max_interval)
+		self.max_motion = max_motion
+		self.max_uncertainty = max_uncertainty
+		# The first frame is always a keyframe
+		self.frames_since_keyframe = self.max_interval
+
+	@property
+	def uses_tracker_state(self):
+		# Decisions look at the tracks after the previous frame, unless every frame is a keyframe
+		return self.base_interval > 1 or self.adaptive
+
+	def is_keyframe(self, tracker):
+		if not self.uses_tracker_state:
+			return True
+		tracks = [t for t in tracker.tracks if t.is_confirmed() and t.time_since_update == 0]
+		self.frames_since_keyframe += 1
+		if self.frames_since_keyframe >= self.interval or self._uncertainty(tracks) > self.max_uncertainty:
+			self.frames_since_keyframe = 0
+			if self.adaptive:
+				self.interval = self._adapted_interval(tracks)
+			return True
+		return False
+
+	@staticmethod
+	def _uncertainty(tracks):
+		# Largest predicted position standard deviation, relative to box height
+		if not tracks:
+			return 0.
+		variance = np.array([t.covariance[0, 0] + t.covariance[1, 1] for t in tracks])
+		height = np.array([t.mean[3] for t in tracks])
+		return float(np.max(np.sqrt(variance) / height))
+
+	def _adapted_interval(self, tracks):
+		if not tracks:
+			return self.base_interval
+		# Fastest track speed per processed frame, relative to box height
+		speed = max(np.hypot(t.mean[4], t.mean[5]) / t.mean[3] for t in tracks)
+		if speed <= 0:
+			return self.max_interval
+		return int(np.clip(self.max_motion / speed, 1, self.max_interval))
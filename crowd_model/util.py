@@ -1,3 +1,4 @@
+import numpy as np
 from scipy.spatial.distance import euclidean
 
 # Calculate shortest distance between two rectangle
@@ -32,6 +33,21 @@ def rect_distance(rect1, rect2):
 		# Rect 1 & 2 intersects
 		return  0
 
+# Shortest distances between the `(x1, y1, x2, y2)` rectangles `rects1[i]` and
+# `rects2[i]`, broadcast like NumPy arrays, the vectorized form of rect_distance
+def rect_gaps(rects1, rects2):
+	(x1, y1, x1b, y1b) = np.moveaxis(np.asarray(rects1, dtype=float), -1, 0)
+	(x2, y2, x2b, y2b) = np.moveaxis(np.asarray(rects2, dtype=float), -1, 0)
+	# Gap along each axis, zero where the rectangles overlap on that axis
+	dx = np.maximum(0, np.maximum(x1 - x2b, x2 - x1b))
+	dy = np.maximum(0, np.maximum(y1 - y2b, y2 - y1b))
+	return np.hypot(dx, dy)
+
+# Shortest distances between all pairs of `(x1, y1, x2, y2)` rectangles
+def rect_distances(rects):
+	rects = np.asarray(rects, dtype=float).reshape(-1, 4)
+	return rect_gaps(rects[:, None, :], rects[None, :, :])
+
 def progress(frame_count):
 	import sys
 	sys.stdout.write('\r')
@@ -43,4 +59,49 @@ def progress(frame_count):
 
 def kinetic_energy(point1, point2, time_step):
 	speed = euclidean(point1, point2) / time_step
-	return int(0.5 * speed ** 2)
\ No newline at end of file
+	return int(0.5 * speed ** 2)
+
+# Kinetic energies of all moves from `points1` to `points2`, the vectorized form of kinetic_energy
+def kinetic_energies(points1, points2, time_step):
+	points1 = np.asarray(points1, dtype=float).reshape(-1, 2)
+	points2 = np.asarray(points2, dtype=float).reshape(-1, 2)
+	speed = np.hypot(*(points1 - points2).T) / time_step
+	return (0.5 * speed ** 2).astype(int)
+
+def analyze_humans(tracks, social_distance, high_cam, time_step, abnormal_energy, sd_check=True, abnormal_check=True,
+	proximity=None):
+	"""Per-frame crowd analytics of the tracked humans, computed on arrays stacked once per frame.
+
+	Returns the integer `(x1, y1, x2, y2)` boxes of the tracks, the number of
+	social distance violations per track, the set of indexes of violating
+	tracks and the set of track ids with abnormal kinetic energy. Crowds of at
+	least `proximity.min_people` are checked for social distance with the
+	`proximity` grid instead of the all pairs distance matrix.
+	"""
+	boxes = np.array([track.to_tlbr() for track in tracks]).reshape(-1, 4).astype(int)
+	violate_count = np.zeros(len(tracks), dtype=int)
+	if sd_check and len(tracks) >= 2:
+		if high_cam:
+			shapes = np.array([track.positions[-1] for track in tracks]).reshape(-1, 2).astype(int)
+		else:
+			shapes = boxes
+		if proximity is not None and len(tracks) >= proximity.min_people:
+			(first, second) = proximity.close_pairs([track.track_id for track in tracks], shapes)
+			violate_count = np.bincount(first, minlength=len(tracks)) + np.bincount(second, minlength=len(tracks))
+		else:
+			if high_cam:
+				distances = np.hypot(*(shapes[:, None, :] - shapes[None, :, :]).transpose(2, 0, 1))
+			else:
+				distances = rect_distances(shapes)
+			violations = distances < social_distance
+			np.fill_diagonal(violations, False)
+			violate_count = violations.sum(axis=1)
+	violate_set = set(np.flatnonzero(violate_count).tolist())
+
+	abnormal_individual = set()
+	if abnormal_check:
+		moving = [track for track in tracks if len(track.positions) >= 2]
+		if moving:
+			energies = kinetic_energies([t.positions[-1] for t in moving], [t.positions[-2] for t in moving], time_step)
+			abnormal_individual = {t.track_id for t, ke in zip(moving, energies) if ke > abnormal_energy}
+	return boxes, violate_count, violate_set, abnormal_individual
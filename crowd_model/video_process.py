@@ -5,24 +5,26 @@ import imutils
 import cv2
 import time
 from math import ceil
-from scipy.spatial.distance import euclidean
-from tracking import detect_human
-from util import rect_distance, progress, kinetic_energy
+from tracking import track_frames, KeyframeScheduler, DETECT, COAST, REUSE
+from motion_gate import MotionGate
+from proximity import ProximityGrid
+from movement_store import MovementStore
+from util import progress, analyze_humans
 from colors import RGB_COLORS
 from config import SHOW_DETECT, DATA_RECORD, RE_CHECK, RE_START_TIME, RE_END_TIME, SD_CHECK, SHOW_VIOLATION_COUNT, SHOW_TRACKING_ID, SOCIAL_DISTANCE,\
-	SHOW_PROCESSING_OUTPUT, YOLO_CONFIG, VIDEO_CONFIG, DATA_RECORD_RATE, ABNORMAL_CHECK, ABNORMAL_ENERGY, ABNORMAL_THRESH, ABNORMAL_MIN_PEOPLE
+	SHOW_PROCESSING_OUTPUT, YOLO_CONFIG, VIDEO_CONFIG, DATA_RECORD_RATE, ABNORMAL_CHECK, ABNORMAL_ENERGY, ABNORMAL_THRESH, ABNORMAL_MIN_PEOPLE,\
+	DETECT_BATCH_SIZE, KEYFRAME_CONFIG, MOTION_GATE_CONFIG, PROXIMITY_GRID_MIN_PEOPLE, MOVEMENT_CONFIG
 from deep_sort import nn_matching
 from deep_sort.detection import Detection
 from deep_sort.tracker import Tracker
-from deep_sort import generate_detections as gdet
 IS_CAM = VIDEO_CONFIG["IS_CAM"]
 HIGH_CAM = VIDEO_CONFIG["HIGH_CAM"]
 
-def _record_movement_data(movement_data_writer, movement):
+def _record_movement_data(movement_data_writer, movement, movement_store):
 	track_id = movement.track_id 
 	entry_time = movement.entry 
 	exit_time = movement.exit			
-	positions = movement.positions
+	positions = movement_store.trajectory(movement)
 	positions = np.array(positions).flatten()
 	positions = list(positions)
 	data = [track_id] + [entry_time] + [exit_time] + positions
@@ -32,14 +34,15 @@ def _record_crowd_data(time, human_count, violate_count, restricted_entry, abnor
 	data = [time, human_count, violate_count, int(restricted_entry), int(abnormal_activity)]
 	crowd_data_writer.writerow(data)
 
-def _end_video(tracker, frame_count, movement_data_writer):
+def _end_video(tracker, frame_count, movement_data_writer, movement_store):
 	for t in tracker.tracks:
 		if t.is_confirmed():
 			t.exit = frame_count
-			_record_movement_data(movement_data_writer, t)
+			_record_movement_data(movement_data_writer, t, movement_store)
+	movement_store.close()
 		
 
-def video_process(cap, frame_size, net, ln, encoder, tracker, movement_data_writer, crowd_data_writer):
+def video_process(cap, frame_size, detector, encoder, tracker, movement_data_writer, crowd_data_writer, stats=None):
 	def _calculate_FPS():
 		t1 = time.time() - t0
 		VID_FPS = frame_count / t1
@@ -63,193 +66,223 @@ def video_process(cap, frame_size, net, ln, encoder, tracker, movement_data_writ
 	RE = False
 	ABNORMAL = False
 
+	# Sampled frames waiting for a batched forward pass, only used for video files
+	batch_size = 1 if IS_CAM else max(1, DETECT_BATCH_SIZE)
+	pending = []
+	# Decides which frames run the detector, the others are tracked with the Kalman filter only
+	keyframes = KeyframeScheduler(KEYFRAME_CONFIG["INTERVAL"], KEYFRAME_CONFIG["ADAPTIVE"], KEYFRAME_CONFIG["MAX_INTERVAL"],
+		KEYFRAME_CONFIG["MAX_MOTION"], KEYFRAME_CONFIG["MAX_UNCERTAINTY"])
+	# Every keyframe decision needs the tracker to have seen the previous frame
+	if keyframes.uses_tracker_state:
+		batch_size = 1
+	# Skips the detector while the scene is static
+	motion_gate = MotionGate(MOTION_GATE_CONFIG["ENABLED"], MOTION_GATE_CONFIG["WIDTH"], MOTION_GATE_CONFIG["PIXEL_THRESH"],
+		MOTION_GATE_CONFIG["MIN_CHANGED_RATIO"], MOTION_GATE_CONFIG["MAX_SKIP"])
+	# Social distance pairs of large crowds, kept between frames as people move
+	proximity = ProximityGrid(SOCIAL_DISTANCE, HIGH_CAM, PROXIMITY_GRID_MIN_PEOPLE)
+	# Older positions of the live tracks, kept on disk until the tracks are recorded
+	movement_store = MovementStore(MOVEMENT_CONFIG["CHUNK_SIZE"], MOVEMENT_CONFIG["TAIL"])
+	# Number of frames that were detected, coasted or reused
+	frame_modes = {DETECT: 0, COAST: 0, REUSE: 0}
+	# Detection runs on the decoded frames, a frame_size copy is only made to draw the output on
+	draw = SHOW_PROCESSING_OUTPUT
+	scale = 1.
+	stop = False
+
 	while True:
-		(ret, frame) = cap.read()
+		# Frames skipped by the record rate are not decoded into an image
+		(ret, frame) = cap.sample(DATA_RECORD_FRAME)
 
-		# Stop the loop when video ends
-		if not ret:
-			_end_video(tracker, frame_count, movement_data_writer)
-			if not VID_FPS:
-				_calculate_FPS()
-			break
+		if ret:
+			# Update frame count
+			if frame_count > 1000000:
+				if not VID_FPS:
+					_calculate_FPS()
+				frame_count = 0
+				display_frame_count = 0
+			frame_count += 1
 
-		# Update frame count
-		if frame_count > 1000000:
-			if not VID_FPS:
-				_calculate_FPS()
-			frame_count = 0
-			display_frame_count = 0
-		frame_count += 1
-		
-		# Skip frames according to given rate
-		if frame_count % DATA_RECORD_FRAME != 0:
-			continue
+			# Skip frames according to given rate
+			if frame is None:
+				continue
 
-		display_frame_count += 1
+			display_frame_count += 1
 
-		# Resize Frame to given size
-		frame = imutils.resize(frame, width=frame_size)
+			# Scale from the decoded frame to the frame_size analytics frame
+			scale = frame_size / float(frame.shape[1])
 
-		# Get current time
-		current_datetime = datetime.datetime.now()
+			# Get current time
+			current_datetime = datetime.datetime.now()
 
-		# Run detection algorithm
-		if IS_CAM:
-			record_time = current_datetime
-		else:
-			record_time = frame_count
-		
-		# Run tracking algorithm
-		[humans_detected, expired] = detect_human(net, ln, frame, encoder, tracker, record_time)
+			# Run detection algorithm
+			if IS_CAM:
+				record_time = current_datetime
+			else:
+				record_time = frame_count
+
+			if motion_gate.is_static(frame, display_frame_count):
+				mode = REUSE
+			elif keyframes.is_keyframe(tracker):
+				mode = DETECT
+			else:
+				mode = COAST
+			frame_modes[mode] += 1
+
+			pending.append((frame, display_frame_count, current_datetime, record_time, mode))
+			# In batch mode, keep collecting frames until the batch has enough frames to detect
+			if batch_size > 1 and sum(p[-1] == DETECT for p in pending) < batch_size:
+				continue
 
-		# Record movement data
-		for movement in expired:
-			_record_movement_data(movement_data_writer, movement)
+		# Detect humans in the pending detection frames and hand the results to the tracker strictly in frame order
+		results = track_frames(detector, encoder, tracker, [p[0] for p in pending], [p[-2] for p in pending], [p[-1] for p in pending], scale)
+		for (frame, display_frame_count, current_datetime, record_time, mode), [humans_detected, expired] in zip(pending, results):
+			# Resize Frame to given size
+			if draw:
+				frame = imutils.resize(frame, width=frame_size)
+
+			# Record movement data
+			for movement in expired:
+				_record_movement_data(movement_data_writer, movement, movement_store)
+			# Spool the old positions of long lived tracks
+			movement_store.flush(tracker.tracks)
 		
-		# Check for restricted entry
-		if RE_CHECK:
-			RE = False
-			if (current_datetime.time() > RE_START_TIME) and (current_datetime.time() < RE_END_TIME) :
-				if len(humans_detected) > 0:
-					RE = True
+			# Check for restricted entry
+			if RE_CHECK:
+				RE = False
+				if (current_datetime.time() > RE_START_TIME) and (current_datetime.time() < RE_END_TIME) :
+					if len(humans_detected) > 0:
+						RE = True
 			
-		# Initiate video process loop
-		if SHOW_PROCESSING_OUTPUT or SHOW_DETECT or SD_CHECK or RE_CHECK or ABNORMAL_CHECK:
-			# Initialize set for violate so an individual will be recorded only once
-			violate_set = set()
-			# Initialize list to record violation count for each individual detected
-			violate_count = np.zeros(len(humans_detected))
-
-			# Initialize list to record id of individual with abnormal energy level
-			abnormal_individual = []
-			ABNORMAL = False
-			for i, track in enumerate(humans_detected):
-				# Get object bounding box
-				[x, y, w, h] = list(map(int, track.to_tlbr().tolist()))
-				# Get object centroid
-				[cx, cy] = list(map(int, track.positions[-1]))
-				# Get object id
-				idx = track.track_id
-				# Check for social distance violation
-				if SD_CHECK:
-					if len(humans_detected) >= 2:
-						# Check the distance between current loop object with the rest of the object in the list
-						for j, track_2 in enumerate(humans_detected[i+1:], start=i+1):
-							if HIGH_CAM:
-								[cx_2, cy_2] = list(map(int, track_2.positions[-1]))
-								distance = euclidean((cx, cy), (cx_2, cy_2))
-							else:
-								[x_2, y_2, w_2, h_2] = list(map(int, track_2.to_tlbr().tolist()))
-								distance = rect_distance((x, y, w, h), (x_2, y_2, w_2, h_2))
-							if distance < SOCIAL_DISTANCE:
-								# Distance between detection less than minimum social distance 
-								violate_set.add(i)
-								violate_count[i] += 1
-								violate_set.add(j)
-								violate_count[j] += 1
-
-				# Compute energy level for each detection
-				if ABNORMAL_CHECK:
-					ke = kinetic_energy(track.positions[-1], track.positions[-2], TIME_STEP)
-					if ke > ABNORMAL_ENERGY:
-						abnormal_individual.append(track.track_id)
-
-				# If restrited entry is on, draw red boxes around each detection
-				if RE:
-					cv2.rectangle(frame, (x + 5 , y + 5 ), (w - 5, h - 5), RGB_COLORS["red"], 5)
-
-				# Draw yellow boxes for detection with social distance violation, green boxes for no violation
-				# Place a number of violation count on top of the box
-				if i in violate_set:
-					cv2.rectangle(frame, (x, y), (w, h), RGB_COLORS["yellow"], 2)
-					if SHOW_VIOLATION_COUNT:
-						cv2.putText(frame, str(int(violate_count[i])), (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, RGB_COLORS["yellow"], 2)
-				elif SHOW_DETECT and not RE:
-					cv2.rectangle(frame, (x, y), (w, h), RGB_COLORS["green"], 2)
-					if SHOW_VIOLATION_COUNT:
-						cv2.putText(frame, str(int(violate_count[i])), (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, RGB_COLORS["green"], 2)
+			# Initiate video process loop
+			if SHOW_PROCESSING_OUTPUT or SHOW_DETECT or SD_CHECK or RE_CHECK or ABNORMAL_CHECK:
+				# Social distance violations and abnormal energy levels of all individuals at once
+				(boxes, violate_count, violate_set, abnormal_individual) = analyze_humans(humans_detected,
+					SOCIAL_DISTANCE, HIGH_CAM, TIME_STEP, ABNORMAL_ENERGY, SD_CHECK, ABNORMAL_CHECK, proximity)
+				ABNORMAL = False
+				for i, track in enumerate(humans_detected):
+					# Nothing to draw on without an output window
+					if not draw:
+						break
+					# Get object bounding box
+					[x, y, w, h] = boxes[i].tolist()
+					# Get object id
+					idx = track.track_id
+
+					# If restrited entry is on, draw red boxes around each detection
+					if RE:
+						cv2.rectangle(frame, (x + 5 , y + 5 ), (w - 5, h - 5), RGB_COLORS["red"], 5)
+
+					# Draw yellow boxes for detection with social distance violation, green boxes for no violation
+					# Place a number of violation count on top of the box
+					if i in violate_set:
+						cv2.rectangle(frame, (x, y), (w, h), RGB_COLORS["yellow"], 2)
+						if SHOW_VIOLATION_COUNT:
+							cv2.putText(frame, str(int(violate_count[i])), (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, RGB_COLORS["yellow"], 2)
+					elif SHOW_DETECT and not RE:
+						cv2.rectangle(frame, (x, y), (w, h), RGB_COLORS["green"], 2)
+						if SHOW_VIOLATION_COUNT:
+							cv2.putText(frame, str(int(violate_count[i])), (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, RGB_COLORS["green"], 2)
 				
-				if SHOW_TRACKING_ID:
-					cv2.putText(frame, str(int(idx)), (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, RGB_COLORS["green"], 2)
+					if SHOW_TRACKING_ID:
+						cv2.putText(frame, str(int(idx)), (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, RGB_COLORS["green"], 2)
 			
-			# Check for overall abnormal level, trigger notification if exceeds threshold
-			if len(humans_detected)  > ABNORMAL_MIN_PEOPLE:
-				if len(abnormal_individual) / len(humans_detected) > ABNORMAL_THRESH:
-					ABNORMAL = True
-
-		# Place violation count on frames
-		if SD_CHECK:
-			# Warning stays on screen for 10 frames
-			if (len(violate_set) > 0):
-				sd_warning_timeout = 10
-			else: 
-				sd_warning_timeout -= 1
-			# Display violation warning and count on screen
-			if sd_warning_timeout > 0:
-				text = "Violation count: {}".format(len(violate_set))
-				cv2.putText(frame, text, (200, frame.shape[0] - 30),
-					cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
-
-		# Place restricted entry warning
-		if RE_CHECK:
-			# Warning stays on screen for 10 frames
-			if RE:
-				re_warning_timeout = 10
-			else: 
-				re_warning_timeout -= 1
-			# Display restricted entry warning and count on screen
-			if re_warning_timeout > 0:
-				if display_frame_count % 3 != 0 :
-					cv2.putText(frame, "RESTRICTED ENTRY", (200, 100),
-						cv2.FONT_HERSHEY_SIMPLEX, 1, RGB_COLORS["red"], 3)
-
-		# Place abnormal activity warning
-		if ABNORMAL_CHECK:
-			if ABNORMAL:
+				# Check for overall abnormal level, trigger notification if exceeds threshold
+				if len(humans_detected)  > ABNORMAL_MIN_PEOPLE:
+					if len(abnormal_individual) / len(humans_detected) > ABNORMAL_THRESH:
+						ABNORMAL = True
+
+			# Place violation count on frames
+			if SD_CHECK:
 				# Warning stays on screen for 10 frames
-				ab_warning_timeout = 10
-				# Draw blue boxes over the the abnormally behave detection if abnormal activity detected
-				for track in humans_detected:
-					if track.track_id in abnormal_individual:
-						[x, y, w, h] = list(map(int, track.to_tlbr().tolist()))
-						cv2.rectangle(frame, (x , y ), (w, h), RGB_COLORS["blue"], 5)
-			else:
-				ab_warning_timeout -= 1
-			if ab_warning_timeout > 0:
-				if display_frame_count % 3 != 0:
-					cv2.putText(frame, "ABNORMAL ACTIVITY", (130, 250),
-						cv2.FONT_HERSHEY_SIMPLEX, 1.5, RGB_COLORS["blue"], 5)
-
-		# Display crowd count on screen
-		if SHOW_DETECT:
-			text = "Crowd count: {}".format(len(humans_detected))
-			cv2.putText(frame, text, (10, 30),
-				cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 3)
-
-		# Display current time on screen
-		# current_date = str(current_datetime.strftime("%b-%d-%Y"))
-		# current_time = str(current_datetime.strftime("%I:%M:%S %p"))
-		# cv2.putText(frame, (current_date), (500, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
-		# cv2.putText(frame, (current_time), (500, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
+				if (len(violate_set) > 0):
+					sd_warning_timeout = 10
+				else: 
+					sd_warning_timeout -= 1
+				# Display violation warning and count on screen
+				if draw and sd_warning_timeout > 0:
+					text = "Violation count: {}".format(len(violate_set))
+					cv2.putText(frame, text, (200, frame.shape[0] - 30),
+						cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
+
+			# Place restricted entry warning
+			if RE_CHECK:
+				# Warning stays on screen for 10 frames
+				if RE:
+					re_warning_timeout = 10
+				else: 
+					re_warning_timeout -= 1
+				# Display restricted entry warning and count on screen
+				if draw and re_warning_timeout > 0:
+					if display_frame_count % 3 != 0 :
+						cv2.putText(frame, "RESTRICTED ENTRY", (200, 100),
+							cv2.FONT_HERSHEY_SIMPLEX, 1, RGB_COLORS["red"], 3)
+
+			# Place abnormal activity warning
+			if ABNORMAL_CHECK:
+				if ABNORMAL:
+					# Warning stays on screen for 10 frames
+					ab_warning_timeout = 10
+					# Draw blue boxes over the the abnormally behave detection if abnormal activity detected
+					for track in humans_detected:
+						if draw and track.track_id in abnormal_individual:
+							[x, y, w, h] = list(map(int, track.to_tlbr().tolist()))
+							cv2.rectangle(frame, (x , y ), (w, h), RGB_COLORS["blue"], 5)
+				else:
+					ab_warning_timeout -= 1
+				if draw and ab_warning_timeout > 0:
+					if display_frame_count % 3 != 0:
+						cv2.putText(frame, "ABNORMAL ACTIVITY", (130, 250),
+							cv2.FONT_HERSHEY_SIMPLEX, 1.5, RGB_COLORS["blue"], 5)
+
+			# Display crowd count on screen
+			if draw and SHOW_DETECT:
+				text = "Crowd count: {}".format(len(humans_detected))
+				cv2.putText(frame, text, (10, 30),
+					cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 3)
+
+			# Display current time on screen
+			# current_date = str(current_datetime.strftime("%b-%d-%Y"))
+			# current_time = str(current_datetime.strftime("%I:%M:%S %p"))
+			# cv2.putText(frame, (current_date), (500, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
+			# cv2.putText(frame, (current_time), (500, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 3)
 		
-		# Record crowd data to file
-		if DATA_RECORD:
-			_record_crowd_data(record_time, len(humans_detected), len(violate_set), RE, ABNORMAL, crowd_data_writer)
-
-		# Display video output or processing indicator
-		if SHOW_PROCESSING_OUTPUT:
-			cv2.imshow("Processed Output", frame)
-		else:
-			progress(display_frame_count)
-
-		# Press 'Q' to stop the video display
-		if cv2.waitKey(1) & 0xFF == ord('q'):
+			# Record crowd data to file
+			if DATA_RECORD:
+				_record_crowd_data(record_time, len(humans_detected), len(violate_set), RE, ABNORMAL, crowd_data_writer)
+
+			# Display video output or processing indicator
+			if SHOW_PROCESSING_OUTPUT:
+				cv2.imshow("Processed Output", frame)
+			else:
+				progress(display_frame_count)
+
+
+			# Press 'Q' to stop the video display
+			if cv2.waitKey(1) & 0xFF == ord('q'):
+				stop = True
+				break
+		pending = []
+
+		# Stop the loop when video ends or 'Q' is pressed
+		if stop or not ret:
 			# Record the movement when video ends
-			_end_video(tracker, frame_count, movement_data_writer)
+			_end_video(tracker, frame_count, movement_data_writer, movement_store)
 			# Compute the processing speed
 			if not VID_FPS:
 				_calculate_FPS()
 			break
-	
+
 	cv2.destroyAllWindows()
+
+	# Report how each processed frame was handled
+	if stats is not None:
+		stats.update({
+			"DETECTED_FRAMES": frame_modes[DETECT],
+			"COASTED_FRAMES": frame_modes[COAST],
+			"REUSED_FRAMES": frame_modes[REUSE]
+		})
+		stats.update(motion_gate.stats())
+		stats.update(movement_store.stats())
+		stats.update(cap.stats())
+
 	return VID_FPS
@@ -0,0 +1,150 @@
+import subprocess
+import threading
+import time
+import queue
+import numpy as np
+import cv2
+
+class OpenCVVideoWriter(object):
+	"""MPEG-4 Part 2 (`mp4v`) output written by `cv2.VideoWriter`."""
+
+	def __init__(self, path, fps, size):
+		self.size = size
+		self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+
+	def write(self, frame):
+		self.writer.write(frame)
+
+	def release(self):
+		self.writer.release()
+
+
+class FFmpegVideoWriter(object):
+	"""
+	H.264 output encoded by an `ffmpeg` subprocess fed through its stdin pipe.
+
+	The files are much smaller than `mp4v` and play in browsers. The
+	`faststart` flag puts the index at the start of the file, so clients
+	can start playing while downloading. Needs the `ffmpeg` executable on
+	the PATH.
+
+	Parameters
+	----------
+	path : str
+		Output video path.
+	fps : float
+		Frame rate of the output video.
+	size : (int, int)
+		Width and height of the output video, rounded down to even numbers
+		as H.264 requires.
+	preset : str
+		x264 speed preset, from `ultrafast` to `veryslow`.
+	crf : int
+		x264 constant rate factor, lower values give better quality and
+		larger files.
+
+	"""
+
+	def __init__(self, path, fps, size, preset="veryfast", crf=23):
+		self.size = (size[0] - size[0] % 2, size[1] - size[1] % 2)
+		command = ["ffmpeg", "-loglevel", "error", "-y",
+			"-f", "rawvideo", "-pix_fmt", "bgr24", "-s", "{}x{}".format(*self.size), "-r", str(fps), "-i", "-",
+			"-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p",
+			"-movflags", "+faststart", path]
+		self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+	def write(self, frame):
+		self.process.stdin.write(memoryview(np.ascontiguousarray(frame)))
+
+	def release(self):
+		self.process.stdin.close()
+		self.process.wait()
+
+
+class BackgroundVideoWriter(object):
+	"""
+	Encodes the output video in a writer thread fed by a bounded queue, so
+	the processing loop does not wait for the encoder.
+
+	Frames are resized to the size of the wrapped writer in the writer
+	thread, and with `step` set only every `step`-th frame is written. The
+	frames must not be changed after they are passed to `write`.
+
+	Parameters
+	----------
+	writer : OpenCVVideoWriter | FFmpegVideoWriter
+		The writer that encodes the frames.
+	queue_size : int
+		Number of frames that can wait for the encoder.
+	step : int
+		Write every `step`-th frame only.
+
+	"""
+
+	def __init__(self, writer, queue_size=16, step=1):
+		self.writer = writer
+		self.step = max(1, step)
+		self.queue = queue.Queue(max(1, queue_size))
+		self.frame_count = 0
+		self.written_frames = 0
+		self.stall = 0.
+		self.error = None
+		self.thread = threading.Thread(target=self._write_frames, daemon=True)
+		self.thread.start()
+
+	def _write_frames(self):
+		while True:
+			frame = self.queue.get()
+			if frame is None:
+				break
+			if self.error is not None:
+				continue
+			try:
+				if (frame.shape[1], frame.shape[0]) != self.writer.size:
+					frame = cv2.resize(frame, self.writer.size, interpolation=cv2.INTER_AREA)
+				self.writer.write(frame)
+				self.written_frames += 1
+			except Exception as e:
+				# Keep draining the queue so the processing loop is never blocked
+				self.error = e
+
+	def write(self, frame):
+		self.frame_count += 1
+		if (self.frame_count - 1) % self.step != 0:
+			return
+		start = time.perf_counter()
+		self.queue.put(frame)
+		self.stall += time.perf_counter() - start
+
+	def stats(self):
+		return {
+			"OUTPUT_WRITTEN_FRAMES": self.written_frames,
+			"OUTPUT_WRITER_STALL_SECONDS": round(self.stall, 3)
+		}
+
+	def release(self):
+		self.queue.put(None)
+		self.thread.join()
+		self.writer.release()
+		if self.error is not None:
+			print("WARNING: Failed to write the output video: {}".format(self.error))
+
+
+def create_video_writer(path, fps, size, config):
+	"""Create the background output video writer selected in `OUTPUT_VIDEO_CONFIG`.
+
+	`size` is the size of the frames passed to `write`. The video is scaled
+	down to the configured width, and its frame rate reduced by the
+	configured step.
+	"""
+	(width, height) = size
+	if config["WIDTH"] and config["WIDTH"] < width:
+		(width, height) = (config["WIDTH"], int(height * config["WIDTH"] / width))
+	step = max(1, config["FRAME_STEP"])
+	if config["ENCODER"] == "ffmpeg":
+		writer = FFmpegVideoWriter(path, fps / step, (width, height), config["PRESET"], config["CRF"])
+	elif config["ENCODER"] == "opencv":
+		writer = OpenCVVideoWriter(path, fps / step, (width, height))
+	else:
+		raise ValueError("Invalid output video encoder; must be one of opencv, ffmpeg")
+	return BackgroundVideoWriter(writer, config["QUEUE_SIZE"], step)